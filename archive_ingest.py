@@ -0,0 +1,222 @@
+"""
+歷史結果批次彙總模組
+將大量封存的 expired_food_results.json 分片給多個行程處理，
+每個行程只回傳精簡的部分彙總 (門市 / 商品 / 分類 / 小時)，再由主行程合併
+"""
+import argparse
+import json
+import math
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Any, Iterable
+
+from output_sinks import atomic_write
+
+
+# 每個 worker 平均分到的分片數，分片小一點可以平衡各檔案大小不一的情況
+SHARDS_PER_WORKER = 4
+
+
+class ArchiveAggregate:
+    """
+    可合併的部分彙總
+
+    只保存計數，不保存原始門市資料，行程之間傳遞的資料量與檔案數無關
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.errors = 0
+        self.store_qty: Counter = Counter()        # (品牌, 店號) → 商品數量
+        self.store_snapshots: Counter = Counter()  # (品牌, 店號) → 出現次數
+        self.store_names: Dict[tuple, str] = {}
+        self.item_qty: Counter = Counter()         # (品牌, 商品) → 商品數量
+        self.category_qty: Counter = Counter()     # (品牌, 分類) → 商品數量
+        self.hour_qty: Counter = Counter()         # "YYYY-MM-DDTHH" → 商品數量
+
+    def add_results(self, results: Dict[str, Any]):
+        """
+        加入一份搜尋結果
+
+        Args:
+            results: expired_food_results.json 的內容
+        """
+        self.files += 1
+        hour = results.get("query_time", "")[:13]
+
+        for store in results.get("all_stores", []):
+            brand = store.get("brand", "")
+            store_key = (brand, str(store.get("store_no", "")))
+            self.store_snapshots[store_key] += 1
+            self.store_names[store_key] = store.get("store_name", "")
+
+            items = store.get("items", [])
+            if items:
+                for item in items:
+                    qty = item.get("qty", 0)
+                    self.item_qty[(brand, item.get("name", ""))] += qty
+                    self.category_qty[(brand, item.get("category", ""))] += qty
+                total = sum(item.get("qty", 0) for item in items)
+            else:
+                # 沒有商品明細時（例如限時搜尋未完成），以分類數量計
+                for category in store.get("categories", []):
+                    self.category_qty[(brand, category.get("name", ""))] += category.get("qty", 0)
+                total = store.get("total_qty", 0)
+
+            self.store_qty[store_key] += total
+            self.hour_qty[hour] += total
+
+    def merge(self, other: "ArchiveAggregate"):
+        """合併另一份部分彙總"""
+        self.files += other.files
+        self.errors += other.errors
+        self.store_qty.update(other.store_qty)
+        self.store_snapshots.update(other.store_snapshots)
+        self.store_names.update(other.store_names)
+        self.item_qty.update(other.item_qty)
+        self.category_qty.update(other.category_qty)
+        self.hour_qty.update(other.hour_qty)
+
+    def to_report(self) -> Dict[str, Any]:
+        """
+        轉成可存成 JSON 的報表
+
+        Returns:
+            {"files", "errors", "stores", "items", "categories", "hours"}，清單依數量排序
+        """
+        return {
+            "files": self.files,
+            "errors": self.errors,
+            "stores": [
+                {
+                    "brand": brand,
+                    "store_no": store_no,
+                    "store_name": self.store_names.get((brand, store_no), ""),
+                    "qty": qty,
+                    "snapshots": self.store_snapshots[(brand, store_no)],
+                }
+                for (brand, store_no), qty in self.store_qty.most_common()
+            ],
+            "items": [
+                {"brand": brand, "name": name, "qty": qty}
+                for (brand, name), qty in self.item_qty.most_common()
+            ],
+            "categories": [
+                {"brand": brand, "name": name, "qty": qty}
+                for (brand, name), qty in self.category_qty.most_common()
+            ],
+            "hours": dict(sorted(self.hour_qty.items())),
+        }
+
+
+def ingest_shard(paths: List[str]) -> ArchiveAggregate:
+    """
+    彙總一個分片（在 worker 行程中執行）
+
+    Args:
+        paths: 結果檔路徑
+
+    Returns:
+        部分彙總
+    """
+    aggregate = ArchiveAggregate()
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                results = json.loads(f.read())
+        except (OSError, ValueError):
+            aggregate.errors += 1
+            continue
+
+        # 目錄中可能有其他 JSON 檔（例如多邊形、設定檔），不是搜尋結果的略過
+        if not isinstance(results, dict) or not isinstance(results.get("all_stores"), list):
+            aggregate.errors += 1
+            continue
+
+        aggregate.add_results(results)
+    return aggregate
+
+
+def collect_files(paths: Iterable[str]) -> List[str]:
+    """
+    展開檔案與目錄（目錄會遞迴找出所有 .json 檔）
+
+    Args:
+        paths: 檔案或目錄
+
+    Returns:
+        排序後的檔案清單
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def make_shards(files: List[str], count: int) -> List[List[str]]:
+    """將檔案清單切成 count 個大小相近的分片"""
+    size = max(1, math.ceil(len(files) / max(1, count)))
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+def ingest_archive(files: List[str], workers: Optional[int] = None) -> ArchiveAggregate:
+    """
+    以多個行程彙總封存的結果檔
+
+    Args:
+        files: 結果檔路徑
+        workers: 行程數，None 表示使用 CPU 核心數
+
+    Returns:
+        合併後的彙總
+    """
+    workers = workers or os.cpu_count() or 1
+    total = ArchiveAggregate()
+
+    if workers == 1:
+        total.merge(ingest_shard(files))
+        return total
+
+    # 依分片順序合併，同數量項目的排序與單一行程時相同
+    shards = make_shards(files, workers * SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for aggregate in executor.map(ingest_shard, shards):
+            total.merge(aggregate)
+
+    return total
+
+
+def main():
+    """彙總封存的搜尋結果"""
+    parser = argparse.ArgumentParser(description="以多行程彙總封存的搜尋結果")
+    parser.add_argument("paths", nargs="+", help="結果檔或目錄")
+    parser.add_argument("--workers", type=int, default=None, help="行程數，預設為 CPU 核心數")
+    parser.add_argument("--output", default="archive_report.json", help="彙總報表輸出檔")
+    parser.add_argument("--top", type=int, default=10, help="畫面上顯示前幾名")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths)
+    print(f"📦 共 {len(files)} 個結果檔")
+
+    report = ingest_archive(files, args.workers).to_report()
+
+    data = json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8")
+    atomic_write(args.output, lambda f: f.write(data))
+
+    print(f"✅ 已彙總 {report['files']} 個檔案（{report['errors']} 個無法讀取或不是搜尋結果）")
+    print("\n🏪 即期品最多的門市:")
+    for store in report["stores"][:args.top]:
+        print(f"   【{store['brand']}】{store['store_name']}: {store['qty']} 個 ({store['snapshots']} 次)")
+    print("\n🍙 最常出現的商品:")
+    for item in report["items"][:args.top]:
+        print(f"   【{item['brand']}】{item['name']}: {item['qty']} 個")
+    print(f"\n📁 報表已儲存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
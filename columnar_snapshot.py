@@ -0,0 +1,292 @@
+"""
+欄位式 (columnar) 快照模組
+將 search_all_stores 的結果存成可 mmap 的平行陣列與字串字典，
+彙總時直接掃描欄位，不需要還原成每個商品一個 dict
+"""
+import argparse
+import array
+import mmap
+import struct
+import sys
+from collections import defaultdict
+from typing import Dict, Any, Tuple, Iterable
+
+
+MAGIC = b"CVSC"
+VERSION = 3
+
+# 欄位名稱與 array typecode，順序即為檔案中的排列順序
+STORE_COLUMNS = [
+    ("store_no", "I"),
+    ("brand", "I"),
+    ("store_name", "I"),
+    ("latitude", "d"),
+    ("longitude", "d"),
+    ("distance", "d"),
+    ("total_qty", "i"),
+]
+ITEM_COLUMNS = [
+    ("item_store", "I"),
+    ("item_name", "I"),
+    ("item_category", "I"),
+    ("item_qty", "i"),
+]
+# 門市的分類摘要（上游回傳的分類數量，商品明細尚未取得的門市也有）
+CATEGORY_COLUMNS = [
+    ("category_store", "I"),
+    ("category_name", "I"),
+    ("category_qty", "i"),
+]
+COLUMNS = STORE_COLUMNS + ITEM_COLUMNS + CATEGORY_COLUMNS
+SECTIONS = ["string_offsets", "string_blob"] + [name for name, _ in COLUMNS]
+
+# MAGIC, 版本, 字串數, 門市數, 商品數, 分類數, query_time 字串 id
+HEADER = struct.Struct("<4sHxxIIIII")
+SECTION_TABLE = struct.Struct(f"<{len(SECTIONS)}Q")
+
+ALIGNMENT = 8
+
+
+def _to_le_bytes(values: array.array) -> bytes:
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_snapshot(results: Dict[str, Any]) -> bytes:
+    """
+    將搜尋結果編碼成欄位式快照
+
+    Args:
+        results: search_all_stores 的回傳結果
+
+    Returns:
+        快照內容
+    """
+    strings: Dict[str, int] = {}
+
+    def intern(value: Any) -> int:
+        value = "" if value is None else str(value)
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    query_time_id = intern(results.get("query_time", ""))
+
+    columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+    nan = float("nan")
+
+    for index, store in enumerate(results.get("all_stores", [])):
+        columns["store_no"].append(intern(store.get("store_no", "")))
+        columns["brand"].append(intern(store.get("brand", "")))
+        columns["store_name"].append(intern(store.get("store_name", "")))
+        columns["latitude"].append(float(store.get("latitude") or nan))
+        columns["longitude"].append(float(store.get("longitude") or nan))
+        columns["distance"].append(float(store.get("distance", nan)))
+        columns["total_qty"].append(int(store.get("total_qty", 0)))
+
+        for item in store.get("items", []):
+            columns["item_store"].append(index)
+            columns["item_name"].append(intern(item.get("name", "")))
+            columns["item_category"].append(intern(item.get("category", "")))
+            columns["item_qty"].append(int(item.get("qty", 0)))
+
+        for category in store.get("categories", []):
+            columns["category_store"].append(index)
+            columns["category_name"].append(intern(category.get("name", "")))
+            columns["category_qty"].append(int(category.get("qty", 0)))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = array.array("I", [0])
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    sections = [_to_le_bytes(string_offsets), b"".join(encoded)]
+    sections += [_to_le_bytes(columns[name]) for name in SECTIONS[2:]]
+
+    offsets = []
+    position = HEADER.size + SECTION_TABLE.size
+    body = []
+    for data in sections:
+        padding = -position % ALIGNMENT
+        body.append(b"\0" * padding)
+        position += padding
+        offsets.append(position)
+        body.append(data)
+        position += len(data)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, len(encoded), len(columns["store_no"]), len(columns["item_store"]),
+        len(columns["category_store"]), query_time_id
+    )
+    return header + SECTION_TABLE.pack(*offsets) + b"".join(body)
+
+
+class SnapshotReader:
+    """
+    欄位式快照讀取器
+
+    以 mmap 開啟檔案，各欄位為直接指向檔案內容的 memoryview，
+    字串只在需要時才解碼
+    """
+
+    def __init__(self, path: str):
+        """
+        開啟快照
+
+        Args:
+            path: 快照檔案路徑
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, self.n_strings, self.n_stores, self.n_items, self.n_categories, \
+            self._query_time_id = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"不支援的快照格式: {path}")
+
+        offsets = SECTION_TABLE.unpack_from(self._mmap, HEADER.size)
+        self._offsets = dict(zip(SECTIONS, offsets))
+        self._columns: Dict[str, Any] = {}
+        self._strings: Dict[int, str] = {}
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """釋放 mmap"""
+        for values in self._columns.values():
+            if isinstance(values, memoryview):
+                values.release()
+        self._columns.clear()
+        self._view.release()
+        self._mmap.close()
+
+    def column(self, name: str):
+        """
+        取得欄位
+
+        Args:
+            name: 欄位名稱，見 STORE_COLUMNS / ITEM_COLUMNS / CATEGORY_COLUMNS
+
+        Returns:
+            可索引、可迭代的數值序列
+        """
+        if name in self._columns:
+            return self._columns[name]
+
+        typecode = dict(COLUMNS + [("string_offsets", "I")])[name]
+        if name == "string_offsets":
+            length = self.n_strings + 1
+        elif name.startswith("item_"):
+            length = self.n_items
+        elif name.startswith("category_"):
+            length = self.n_categories
+        else:
+            length = self.n_stores
+
+        start = self._offsets[name]
+        size = array.array(typecode).itemsize * length
+        view = self._view[start:start + size]
+
+        if sys.byteorder == "little":
+            values = view.cast(typecode)
+        else:
+            values = array.array(typecode, view.tobytes())
+            values.byteswap()
+
+        self._columns[name] = values
+        return values
+
+    def string(self, string_id: int) -> str:
+        """取得字串字典中的字串"""
+        if string_id not in self._strings:
+            offsets = self.column("string_offsets")
+            base = self._offsets["string_blob"]
+            start = base + offsets[string_id]
+            end = base + offsets[string_id + 1]
+            self._strings[string_id] = bytes(self._view[start:end]).decode("utf-8")
+        return self._strings[string_id]
+
+    @property
+    def query_time(self) -> str:
+        return self.string(self._query_time_id)
+
+    def qty_by(self, keys: Tuple[str, ...]) -> Dict[Tuple[str, ...], int]:
+        """
+        依指定欄位彙總商品數量
+
+        Args:
+            keys: 分組欄位，可為 "brand"、"store_no"、"store_name"、"category"、"name"
+
+        Returns:
+            {分組值: 數量總和}
+        """
+        id_columns = []
+        for key in keys:
+            if key in ("brand", "store_no", "store_name"):
+                store_column = self.column(key)
+                id_columns.append([store_column[i] for i in self.column("item_store")])
+            elif key == "category":
+                id_columns.append(self.column("item_category"))
+            elif key == "name":
+                id_columns.append(self.column("item_name"))
+            else:
+                raise ValueError(f"不支援的分組欄位: {key}")
+
+        totals: Dict[Tuple[int, ...], int] = defaultdict(int)
+        for group, qty in zip(zip(*id_columns), self.column("item_qty")):
+            totals[group] += qty
+
+        # 只對實際出現的分組解碼字串
+        return {
+            tuple(self.string(i) for i in group): qty
+            for group, qty in totals.items()
+        }
+
+
+def aggregate_qty(
+    paths: Iterable[str],
+    keys: Tuple[str, ...] = ("brand", "category")
+) -> Dict[Tuple[str, ...], int]:
+    """
+    彙總多個快照的商品數量
+
+    Args:
+        paths: 快照檔案路徑
+        keys: 分組欄位
+
+    Returns:
+        {分組值: 數量總和}
+    """
+    totals: Dict[Tuple[str, ...], int] = defaultdict(int)
+    for path in paths:
+        with SnapshotReader(path) as reader:
+            for group, qty in reader.qty_by(keys).items():
+                totals[group] += qty
+    return dict(totals)
+
+
+def main():
+    """彙總欄位式快照"""
+    parser = argparse.ArgumentParser(description="彙總欄位式快照的即期品數量")
+    parser.add_argument("snapshots", nargs="+", help="快照檔案")
+    parser.add_argument("--by", default="brand,category", help="分組欄位，以逗號分隔")
+    args = parser.parse_args()
+
+    keys = tuple(k.strip() for k in args.by.split(",") if k.strip())
+    totals = aggregate_qty(args.snapshots, keys)
+
+    for group, qty in sorted(totals.items(), key=lambda x: -x[1]):
+        print(f"{' / '.join(group)}: {qty}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,767 @@
+"""
+區域查詢覆蓋規劃模組
+給定多邊形或矩形範圍，以六角格網計算近似最少的查詢中心點 (以圓覆蓋區域)，
+並從實際回應學習 GetNearbyStoreList / MapProductInfo 的有效回傳半徑
+"""
+import argparse
+import copy
+import json
+import math
+import os
+from typing import Optional, List, Dict, Any, Tuple, Callable
+
+from seven_eleven import SevenElevenAPI
+from family_mart import FamilyMartAPI
+from output_sinks import atomic_write
+from rate_limiter import BACKGROUND, build_rate_limiter
+
+
+EARTH_RADIUS = 6371000  # 地球半徑（公尺）
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+SEVEN_ELEVEN_ENDPOINT = "GetNearbyStoreList"
+FAMILY_MART_ENDPOINT = "MapProductInfo"
+
+# 有效半徑下限（公尺），避免學習到過小的半徑時規劃出大量查詢
+MIN_RADIUS = 100.0
+
+LatLon = Tuple[float, float]
+
+
+def bbox_to_polygon(south: float, west: float, north: float, east: float) -> List[LatLon]:
+    """將矩形範圍轉成多邊形頂點 (lat, lon)"""
+    return [(south, west), (south, east), (north, east), (north, west)]
+
+
+def point_in_polygon(x: float, y: float, polygon: List[Tuple[float, float]]) -> bool:
+    """射線法判斷點是否在多邊形內"""
+    inside = False
+    n = len(polygon)
+    for i in range(n):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % n]
+        if (y1 > y) != (y2 > y):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            if x < x_cross:
+                inside = not inside
+    return inside
+
+
+class LocalProjection:
+    """以區域中心為原點的等距圓柱投影，小範圍內可直接以公尺計算距離"""
+
+    def __init__(self, lat0: float, lon0: float):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.x_scale = METERS_PER_DEGREE * math.cos(math.radians(lat0))
+
+    def to_xy(self, lat: float, lon: float) -> Tuple[float, float]:
+        return ((lon - self.lon0) * self.x_scale, (lat - self.lat0) * METERS_PER_DEGREE)
+
+    def to_latlon(self, x: float, y: float) -> LatLon:
+        return (self.lat0 + y / METERS_PER_DEGREE, self.lon0 + x / self.x_scale)
+
+
+class RadiusEstimator:
+    """
+    有效回傳半徑估計器
+
+    上游 API 只回傳一定範圍內的門市，回應中最遠門市的距離只是這個範圍的下限，
+    因此未截斷的回應只會把已知的回傳範圍往上調，不會讓估計值變小。
+    回應筆數達到上限 (被截斷) 時，該次查詢只涵蓋到最遠的門市為止，
+    只有這類回應會用來縮小規劃半徑（門市密集的區域）；估計值不會小於 min_radius
+    """
+
+    MAX_OBSERVATIONS = 200
+
+    # 回應筆數重複達到同一個最大值這麼多次，才視為上游的筆數上限
+    # （未截斷時筆數各次不同，最大值很少重複出現）
+    CAP_CONFIRMATIONS = 10
+    CAP_MIN_RESULTS = 5
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        default_radius: float = 500,
+        quantile: float = 0.25,
+        min_radius: float = MIN_RADIUS,
+        max_results: Optional[Dict[str, int]] = None
+    ):
+        """
+        初始化半徑估計器
+
+        Args:
+            path: 觀察值保存的 JSON 檔，None 表示不保存
+            default_radius: 設定的回傳半徑（公尺），估計值不會因未截斷的回應而低於此值
+            quantile: 截斷回應的距離取用的分位數
+            min_radius: 半徑下限（公尺），避免規劃出過多的查詢中心
+            max_results: 已知的各端點回應筆數上限，未設定的端點由觀察推斷
+        """
+        self.path = path
+        self.default_radius = default_radius
+        self.quantile = quantile
+        self.min_radius = min_radius
+        self.max_results = max_results or {}
+        self.observations: Dict[str, Dict[str, Any]] = {}
+        # 估計值有變動才需要寫回檔案
+        self._dirty = False
+
+        for endpoint, state in self._load().items():
+            self._state(endpoint).update(state)
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """讀取保存的觀察值"""
+        if not (self.path and os.path.exists(self.path)):
+            return {}
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for endpoint, state in data.items():
+            if isinstance(state, list):
+                # 舊格式只記錄每次回應的最遠距離，都只能當成回傳範圍的下限
+                data[endpoint] = {"reach": max(state, default=0.0)}
+        return data
+
+    def _state(self, endpoint: str) -> Dict[str, Any]:
+        return self.observations.setdefault(
+            endpoint, {"reach": 0.0, "capped": [], "max_count": 0, "max_count_hits": 0}
+        )
+
+    def _summary(self, endpoint: str) -> Tuple[float, float, int, int]:
+        """影響估計結果的狀態，用來判斷是否需要保存"""
+        state = self._state(endpoint)
+        return (
+            self.radius(endpoint),
+            self.reach(endpoint),
+            state["max_count"],
+            min(state["max_count_hits"], self.CAP_CONFIRMATIONS),
+        )
+
+    def is_capped(self, endpoint: str, count: int) -> bool:
+        """
+        判斷回應筆數是否達到上游的上限
+
+        Args:
+            endpoint: 端點名稱
+            count: 回應筆數
+
+        Returns:
+            是否被截斷
+        """
+        if endpoint in self.max_results:
+            return count >= self.max_results[endpoint]
+        state = self._state(endpoint)
+        return (
+            count >= self.CAP_MIN_RESULTS
+            and count == state["max_count"]
+            and state["max_count_hits"] >= self.CAP_CONFIRMATIONS
+        )
+
+    def observe(self, endpoint: str, distances: List[float]) -> bool:
+        """
+        記錄一次查詢回應
+
+        Args:
+            endpoint: 端點名稱
+            distances: 回傳門市與查詢中心的距離（公尺）
+
+        Returns:
+            回應是否可能被截斷（是的話只能確定涵蓋到最遠的門市為止）
+        """
+        if not distances:
+            return False
+
+        before = self._summary(endpoint)
+        try:
+            return self._observe(endpoint, distances)
+        finally:
+            if self._summary(endpoint) != before:
+                self._dirty = True
+
+    def _observe(self, endpoint: str, distances: List[float]) -> bool:
+        state = self._state(endpoint)
+        count = len(distances)
+        if count > state["max_count"]:
+            state["max_count"] = count
+            state["max_count_hits"] = 1
+        elif count == state["max_count"]:
+            state["max_count_hits"] += 1
+
+        farthest = round(max(distances), 2)
+        if self.is_capped(endpoint, count):
+            state["capped"].append(farthest)
+            del state["capped"][:-self.MAX_OBSERVATIONS]
+            return True
+
+        state["reach"] = max(state["reach"], farthest)
+        # 上限尚未確認時，筆數等於目前最大值的回應仍可能被截斷，
+        # 涵蓋範圍保守地只算到最遠的門市，但不拿來縮小規劃半徑
+        return (
+            endpoint not in self.max_results
+            and count >= self.CAP_MIN_RESULTS
+            and count == state["max_count"]
+        )
+
+    def reach(self, endpoint: str) -> float:
+        """取得未截斷的回應涵蓋的半徑（公尺）"""
+        return max(self.default_radius, self._state(endpoint)["reach"], self.min_radius)
+
+    def radius(self, endpoint: str) -> float:
+        """取得端點目前的規劃半徑（公尺）"""
+        radius = self.reach(endpoint)
+        values = sorted(self._state(endpoint)["capped"])
+        if values:
+            index = min(len(values) - 1, int(len(values) * self.quantile))
+            radius = min(radius, values[index])
+        return max(radius, self.min_radius)
+
+    def save(self):
+        """
+        估計值有變動時保存觀察值
+
+        寫入前重新讀取檔案並合併其他行程保存的結果（回傳範圍取較大者、
+        筆數上限取觀察較多者），同時執行的程式不會互相蓋掉學到的半徑
+        """
+        if not self.path or not self._dirty:
+            return
+
+        for endpoint, other in self._load().items():
+            state = self._state(endpoint)
+            state["reach"] = max(state["reach"], other.get("reach", 0.0))
+            other_count = (other.get("max_count", 0), other.get("max_count_hits", 0))
+            if other_count > (state["max_count"], state["max_count_hits"]):
+                state["max_count"], state["max_count_hits"] = other_count
+            if not state["capped"]:
+                state["capped"] = list(other.get("capped", []))
+
+        data = json.dumps(self.observations, ensure_ascii=False).encode("utf-8")
+        atomic_write(self.path, lambda f: f.write(data))
+        self._dirty = False
+
+
+def hexagon(cx: float, cy: float, radius: float) -> List[Tuple[float, float]]:
+    """外接圓半徑為 radius 的尖頂正六邊形頂點（投影座標）"""
+    return [
+        (cx + radius * math.cos(math.radians(30 + 60 * k)), cy + radius * math.sin(math.radians(30 + 60 * k)))
+        for k in range(6)
+    ]
+
+
+def _segment_params(
+    p1: Tuple[float, float],
+    p2: Tuple[float, float],
+    q1: Tuple[float, float],
+    q2: Tuple[float, float]
+) -> Optional[float]:
+    """線段 p1-p2 與 q1-q2 交點在 p1-p2 上的參數 t，不相交 (或平行) 時回傳 None"""
+    dx, dy = p2[0] - p1[0], p2[1] - p1[1]
+    ex, ey = q2[0] - q1[0], q2[1] - q1[1]
+    denominator = dx * ey - dy * ex
+    if denominator == 0:
+        return None
+
+    fx, fy = q1[0] - p1[0], q1[1] - p1[1]
+    t = (fx * ey - fy * ex) / denominator
+    u = (fx * dy - fy * dx) / denominator
+    if 0 <= t <= 1 and 0 <= u <= 1:
+        return t
+    return None
+
+
+def clip_segments(
+    a: List[Tuple[float, float]],
+    b: List[Tuple[float, float]]
+) -> List[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """取得多邊形 a 的邊落在多邊形 b 內的線段"""
+    segments = []
+    for i in range(len(a)):
+        p, q = a[i], a[(i + 1) % len(a)]
+        cuts = [0.0, 1.0]
+        for j in range(len(b)):
+            t = _segment_params(p, q, b[j], b[(j + 1) % len(b)])
+            if t is not None:
+                cuts.append(t)
+        cuts.sort()
+
+        for t0, t1 in zip(cuts, cuts[1:]):
+            if t1 - t0 < 1e-9:
+                continue
+            middle = (t0 + t1) / 2
+            if point_in_polygon(p[0] + (q[0] - p[0]) * middle, p[1] + (q[1] - p[1]) * middle, b):
+                segments.append((
+                    (p[0] + (q[0] - p[0]) * t0, p[1] + (q[1] - p[1]) * t0),
+                    (p[0] + (q[0] - p[0]) * t1, p[1] + (q[1] - p[1]) * t1),
+                ))
+    return segments
+
+
+Disk = Tuple[float, float, float]  # (x, y, 半徑)
+
+
+def segment_covered(p: Tuple[float, float], q: Tuple[float, float], disks: List[Disk]) -> bool:
+    """線段是否完全落在圓的聯集內"""
+    dx, dy = q[0] - p[0], q[1] - p[1]
+    a = dx * dx + dy * dy
+    intervals = []
+    for cx, cy, r in disks:
+        fx, fy = p[0] - cx, p[1] - cy
+        b = 2 * (fx * dx + fy * dy)
+        c = fx * fx + fy * fy - r * r
+        discriminant = b * b - 4 * a * c
+        if discriminant < 0:
+            continue
+        root = math.sqrt(discriminant)
+        start, end = max(0.0, (-b - root) / (2 * a)), min(1.0, (-b + root) / (2 * a))
+        if start <= end:
+            intervals.append((start, end))
+
+    reached = 0.0
+    for start, end in sorted(intervals):
+        if start > reached + 1e-9:
+            return False
+        reached = max(reached, end)
+    return reached >= 1.0 - 1e-9
+
+
+def circle_intersections(d1: Disk, d2: Disk) -> List[Tuple[float, float]]:
+    """兩圓周的交點"""
+    x1, y1, r1 = d1
+    x2, y2, r2 = d2
+    d = math.hypot(x2 - x1, y2 - y1)
+    if d == 0 or d > r1 + r2 or d < abs(r1 - r2):
+        return []
+    a = (r1 * r1 - r2 * r2 + d * d) / (2 * d)
+    h = math.sqrt(max(0.0, r1 * r1 - a * a))
+    mx, my = x1 + a * (x2 - x1) / d, y1 + a * (y2 - y1) / d
+    return [
+        (mx + h * (y2 - y1) / d, my - h * (x2 - x1) / d),
+        (mx - h * (y2 - y1) / d, my + h * (x2 - x1) / d),
+    ]
+
+
+def point_covered(x: float, y: float, disks: List[Disk]) -> bool:
+    """
+    點的某個鄰域是否完全落在圓的聯集內
+
+    點在某個圓內部即成立；點剛好在數個圓周上時，這些圓心的方向必須環繞該點
+    （相鄰方向的夾角都小於 180 度），否則附近會有沒被涵蓋的楔形區域
+    """
+    angles = []
+    for cx, cy, r in disks:
+        d = math.hypot(x - cx, y - cy)
+        if d < r * (1 - 1e-9):
+            return True
+        if d <= r * (1 + 1e-9):
+            angles.append(math.atan2(cy - y, cx - x))
+    if len(angles) < 3:
+        return False
+
+    angles.sort()
+    gaps = [b - a for a, b in zip(angles, angles[1:])]
+    gaps.append(angles[0] + 2 * math.pi - angles[-1])
+    return max(gaps) < math.pi - 1e-9
+
+
+def region_covered(
+    region: List[Tuple[float, float]],
+    polygon: List[Tuple[float, float]],
+    disks: List[Disk]
+) -> bool:
+    """
+    region 與 polygon 的交集是否完全落在圓的聯集內
+
+    交集的邊界都被涵蓋、且交集內部每個圓周交點都在另一個圓內時，
+    聯集中不可能有空洞，交集即被完全涵蓋（判斷偏保守，邊界情況會回傳 False）
+    """
+    boundary = clip_segments(region, polygon) + clip_segments(polygon, region)
+    for p, q in boundary:
+        if not segment_covered(p, q, disks):
+            return False
+
+    for i in range(len(disks)):
+        for j in range(i + 1, len(disks)):
+            for x, y in circle_intersections(disks[i], disks[j]):
+                if not (point_in_polygon(x, y, region) and point_in_polygon(x, y, polygon)):
+                    continue
+                if not point_covered(x, y, disks):
+                    return False
+    return True
+
+
+class _Cell:
+    """六角格網中的一格，查詢中心即為格子中心"""
+
+    def __init__(self, x: float, y: float, radius: float, interior: bool):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.hexagon = hexagon(x, y, radius)
+        self.interior = interior  # 整格都在區域內，邊緣刪減時不需檢查
+
+    @property
+    def disk(self) -> Disk:
+        return (self.x, self.y, self.radius)
+
+
+class CoveragePlanner:
+    """
+    區域覆蓋規劃器
+
+    以外接圓半徑等於查詢半徑的六角格網鋪滿區域（以等半徑圓覆蓋平面最省的排列），
+    只保留與區域相交的格子，嘗試數種格網偏移取格數最少者，
+    再以貪婪法刪除邊緣格：格子落在區域內的部分已被其他圓的聯集涵蓋時即可省略。
+    涵蓋以幾何方式判斷，規劃出的圓一定涵蓋整個區域
+    """
+
+    def __init__(self, polygon: List[LatLon], density: int = 3):
+        """
+        初始化覆蓋規劃器
+
+        Args:
+            polygon: 區域多邊形頂點 (lat, lon)
+            density: 每個方向嘗試的格網偏移數，越大越可能找到較少的中心但越慢
+        """
+        if len(polygon) < 3:
+            raise ValueError("多邊形至少需要 3 個頂點")
+
+        self.polygon = polygon
+        self.density = max(1, density)
+        lat0 = sum(p[0] for p in polygon) / len(polygon)
+        lon0 = sum(p[1] for p in polygon) / len(polygon)
+        self.projection = LocalProjection(lat0, lon0)
+        self.polygon_xy = [self.projection.to_xy(lat, lon) for lat, lon in polygon]
+
+    def _covered(self, region: List[Tuple[float, float]], radius: float, disks: List[Disk]) -> bool:
+        """region (外接圓半徑 radius 的六角格) 落在區域內的部分是否被 disks 涵蓋"""
+        cx = sum(p[0] for p in region) / len(region)
+        cy = sum(p[1] for p in region) / len(region)
+        near = [d for d in disks if math.hypot(d[0] - cx, d[1] - cy) < d[2] + radius]
+        return region_covered(region, self.polygon_xy, near)
+
+    def _lattice(
+        self,
+        radius: float,
+        offset_x: float,
+        offset_y: float,
+        bounds: Tuple[float, float, float, float],
+        within: Optional[List[List[Tuple[float, float]]]] = None
+    ) -> List[_Cell]:
+        """
+        取得指定偏移的六角格網中與區域相交的格子
+
+        Args:
+            radius: 格子外接圓半徑
+            offset_x: 格網水平偏移
+            offset_y: 格網垂直偏移
+            bounds: 格網範圍 (min_x, min_y, max_x, max_y)
+            within: 只保留與這些六角格相交的格子，None 表示不限
+        """
+        width = math.sqrt(3) * radius
+        height = 1.5 * radius
+        min_x, min_y, max_x, max_y = bounds
+
+        cells = []
+        row = math.floor((min_y - radius - offset_y) / height)
+        while offset_y + row * height <= max_y + radius:
+            y = offset_y + row * height
+            shift = offset_x + (width / 2 if row % 2 else 0.0)
+            column = math.floor((min_x - radius - shift) / width)
+            while shift + column * width <= max_x + radius:
+                x = shift + column * width
+                column += 1
+
+                shape = hexagon(x, y, radius)
+                inside = sum(1 for p in shape if point_in_polygon(p[0], p[1], self.polygon_xy))
+                boundary = clip_segments(self.polygon_xy, shape)
+                if not inside and not boundary:
+                    continue
+                if within is not None and not any(
+                    clip_segments(shape, other) or clip_segments(other, shape) for other in within
+                ):
+                    continue
+                cells.append(_Cell(x, y, radius, inside == len(shape) and not boundary))
+            row += 1
+        return cells
+
+    def _prune(self, cells: List[_Cell], fixed: List[Disk]) -> List[_Cell]:
+        """
+        貪婪刪除邊緣格
+
+        格子落在區域內的部分被其餘格子與 fixed 的圓聯集涵蓋，
+        且先前刪除的鄰近格子也仍被涵蓋時，才刪除這一格
+        """
+        if not cells:
+            return cells
+
+        radius = cells[0].radius
+        removed: List[_Cell] = []
+        kept = set(id(cell) for cell in cells)
+
+        def disks_near(x: float, y: float, excluded: _Cell) -> List[Disk]:
+            near = [
+                cell.disk for cell in cells
+                if id(cell) in kept and cell is not excluded
+                and math.hypot(cell.x - x, cell.y - y) < 2 * radius
+            ]
+            near.extend(d for d in fixed if math.hypot(d[0] - x, d[1] - y) < d[2] + radius)
+            return near
+
+        # 先嘗試刪除與區域交集較小的格子（落在區域內的頂點較少）
+        edges = [cell for cell in cells if not cell.interior]
+        edges.sort(key=lambda c: sum(1 for p in c.hexagon if point_in_polygon(p[0], p[1], self.polygon_xy)))
+        for cell in edges:
+            if not region_covered(cell.hexagon, self.polygon_xy, disks_near(cell.x, cell.y, cell)):
+                continue
+            if all(
+                region_covered(other.hexagon, self.polygon_xy, disks_near(other.x, other.y, cell))
+                for other in removed
+                if math.hypot(other.x - cell.x, other.y - cell.y) < 4 * radius
+            ):
+                kept.discard(id(cell))
+                removed.append(cell)
+
+        return [cell for cell in cells if id(cell) in kept]
+
+    def _cover(
+        self,
+        radius: float,
+        bounds: Optional[Tuple[float, float, float, float]] = None,
+        within: Optional[List[List[Tuple[float, float]]]] = None,
+        fixed: Optional[List[Disk]] = None
+    ) -> Tuple[List[_Cell], List[_Cell]]:
+        """
+        嘗試各種格網偏移，取刪減後格數最少的規劃
+
+        Args:
+            radius: 查詢半徑
+            bounds: 格網範圍，None 表示整個區域
+            within: 只需涵蓋與這些六角格相交的部分
+            fixed: 已查詢過的圓，已被涵蓋的格子不再規劃
+
+        Returns:
+            (需要查詢的格子, 該格網中與區域相交的所有格子)
+        """
+        if radius <= 0:
+            raise ValueError("半徑必須大於 0")
+
+        if bounds is None:
+            xs = [p[0] for p in self.polygon_xy]
+            ys = [p[1] for p in self.polygon_xy]
+            bounds = (min(xs), min(ys), max(xs), max(ys))
+        fixed = fixed or []
+
+        width = math.sqrt(3) * radius
+        height = 1.5 * radius
+        best: Optional[Tuple[List[_Cell], List[_Cell]]] = None
+        for i in range(self.density):
+            for j in range(self.density):
+                regions = self._lattice(
+                    radius, width * i / self.density, height * j / self.density, bounds, within
+                )
+                cells = self._prune(
+                    [cell for cell in regions if not self._covered(cell.hexagon, radius, fixed)],
+                    fixed
+                )
+                if best is None or len(cells) < len(best[0]):
+                    best = (cells, regions)
+        return best or ([], [])
+
+    def plan(self, radius: float) -> List[LatLon]:
+        """
+        計算覆蓋區域的查詢中心
+
+        Args:
+            radius: 每次查詢的有效半徑（公尺）
+
+        Returns:
+            查詢中心 (lat, lon) 清單，依格網由南到北、由西到東排序
+        """
+        cells, _ = self._cover(radius)
+        return [self.projection.to_latlon(cell.x, cell.y) for cell in cells]
+
+    def run(
+        self,
+        query: Callable[[float, float], List[float]],
+        estimator: RadiusEstimator,
+        endpoint: str
+    ) -> List[LatLon]:
+        """
+        依規劃結果逐一查詢，並依實際回應補查
+
+        未截斷的回應涵蓋估計器的完整回傳半徑；被截斷的回應只涵蓋到最遠的門市。
+        每一輪查詢完後檢查各格是否確實被涵蓋，未涵蓋的格子以較小的格網補查
+        （格網半徑取附近截斷回應的實際半徑，但不小於估計器的 min_radius）
+
+        Args:
+            query: 查詢函數，接收 (lat, lon) 並回傳各門市與中心的距離（公尺）
+            estimator: 半徑估計器
+            endpoint: 端點名稱
+
+        Returns:
+            實際查詢過的中心 (lat, lon) 清單
+        """
+        queue, regions = self._cover(estimator.radius(endpoint))
+        queried = []
+        disks: List[Disk] = []
+
+        while queue:
+            for cell in queue:
+                lat, lon = self.projection.to_latlon(cell.x, cell.y)
+                distances = query(lat, lon)
+                queried.append((lat, lon))
+
+                if estimator.observe(endpoint, distances):
+                    disks.append((cell.x, cell.y, max(distances)))
+                else:
+                    disks.append((cell.x, cell.y, estimator.reach(endpoint)))
+
+            # 依補查半徑分組，同一組的缺口以同一個格網補查
+            groups: Dict[float, List[_Cell]] = {}
+            for region in regions:
+                if self._covered(region.hexagon, region.radius, disks):
+                    continue
+                short = [
+                    r for x, y, r in disks
+                    if r < region.radius and math.hypot(x - region.x, y - region.y) < 2 * region.radius
+                ]
+                radius = min(short) if short else region.radius / 2
+                radius = max(min(radius, estimator.radius(endpoint)), estimator.min_radius)
+                if radius >= region.radius:
+                    # 已是最小格網，門市密集到單次查詢仍被截斷，無法再細分
+                    continue
+                groups.setdefault(radius, []).append(region)
+
+            queue, regions = [], []
+            for radius, group in groups.items():
+                xs = [p[0] for region in group for p in region.hexagon]
+                ys = [p[1] for region in group for p in region.hexagon]
+                cells, sub_regions = self._cover(
+                    radius, (min(xs), min(ys), max(xs), max(ys)), [r.hexagon for r in group], disks
+                )
+                queue.extend(cells)
+                regions.extend(sub_regions)
+
+        estimator.save()
+        return queried
+
+
+def crawl_region(
+    polygon: List[LatLon],
+    estimator: RadiusEstimator,
+    seven_eleven_api: Optional[SevenElevenAPI] = None,
+    family_mart_api: Optional[FamilyMartAPI] = None,
+    density: int = 3,
+    priority: str = BACKGROUND
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    以最少的上游呼叫抓取區域內所有門市的原始資料
+
+    Args:
+        polygon: 區域多邊形頂點 (lat, lon)
+        estimator: 半徑估計器
+        seven_eleven_api: SevenElevenAPI 實例，None 表示略過
+        family_mart_api: FamilyMartAPI 實例，None 表示略過
+        density: 取樣密度
+        priority: 抓取時的請求優先權，預設為背景，額度優先讓給互動查詢
+
+    Returns:
+        {"seven_eleven": {店號: 原始資料}, "family_mart": {店號: 原始資料}}
+    """
+    # 以複本套用優先權，不影響呼叫端的 API 實例
+    if seven_eleven_api:
+        seven_eleven_api = copy.copy(seven_eleven_api)
+        seven_eleven_api.priority = priority
+    if family_mart_api:
+        family_mart_api = copy.copy(family_mart_api)
+        family_mart_api.priority = priority
+
+    planner = CoveragePlanner(polygon, density)
+    collected: Dict[str, Dict[str, Dict[str, Any]]] = {"seven_eleven": {}, "family_mart": {}}
+
+    if seven_eleven_api:
+        def query_seven_eleven(lat: float, lon: float) -> List[float]:
+            stores = seven_eleven_api.get_nearby_store_list(lat, lon)
+            for store in stores:
+                collected["seven_eleven"][store.get("StoreNo", "")] = store
+            return [s.get("Distance", 0) for s in stores]
+
+        queried = planner.run(query_seven_eleven, estimator, SEVEN_ELEVEN_ENDPOINT)
+        print(f"   7-11: {len(queried)} 次查詢，{len(collected['seven_eleven'])} 間門市")
+
+    if family_mart_api:
+        def query_family_mart(lat: float, lon: float) -> List[float]:
+            stores = family_mart_api.get_stores_by_coords(lat, lon)
+            distances = []
+            for store in stores:
+                store_lat = store.get("latitude", 0)
+                store_lon = store.get("longitude", 0)
+                if store_lat and store_lon:
+                    collected["family_mart"][store.get("oldPKey", "")] = store
+                    distances.append(FamilyMartAPI.calculate_distance(lat, lon, store_lat, store_lon))
+            return distances
+
+        queried = planner.run(query_family_mart, estimator, FAMILY_MART_ENDPOINT)
+        print(f"   全家: {len(queried)} 次查詢，{len(collected['family_mart'])} 間門市")
+
+    return collected
+
+
+def main():
+    """印出區域覆蓋規劃"""
+    parser = argparse.ArgumentParser(description="計算覆蓋區域所需的查詢中心")
+    parser.add_argument("--bbox", nargs=4, type=float, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    parser.add_argument("--polygon", help="多邊形頂點 JSON 檔，格式為 [[lat, lon], ...]")
+    parser.add_argument("--radius-file", default=".coverage_radius.json", help="學習到的半徑保存檔")
+    parser.add_argument("--density", type=int, default=3, help="每個方向嘗試的格網偏移數")
+    parser.add_argument(
+        "--max-results", nargs=2, action="append", default=[], metavar=("ENDPOINT", "N"),
+        help="已知的端點回應筆數上限，未指定時由回應推斷"
+    )
+    parser.add_argument("--crawl", metavar="OUTPUT", help="依規劃實際抓取門市原始資料並存成 JSON（背景優先權）")
+    args = parser.parse_args()
+
+    if args.polygon:
+        with open(args.polygon, "r", encoding="utf-8") as f:
+            polygon = [tuple(p) for p in json.load(f)]
+    elif args.bbox:
+        polygon = bbox_to_polygon(*args.bbox)
+    else:
+        parser.error("請指定 --bbox 或 --polygon")
+
+    estimator = RadiusEstimator(
+        args.radius_file,
+        max_results={endpoint: int(count) for endpoint, count in args.max_results}
+    )
+
+    if args.crawl:
+        config_dir = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(config_dir, "config.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+        rate_limiter = build_rate_limiter(config.get("rate_limit"), config_dir)
+        seven_eleven_api = None
+        family_mart_api = None
+        if config["seven_eleven"]["enabled"]:
+            seven_eleven_api = SevenElevenAPI(config["seven_eleven"]["mid_v"], rate_limiter, BACKGROUND)
+        if config["family_mart"]["enabled"]:
+            family_mart_api = FamilyMartAPI(config["family_mart"]["project_code"], rate_limiter, BACKGROUND)
+
+        print("🔍 抓取區域內門市...")
+        collected = crawl_region(polygon, estimator, seven_eleven_api, family_mart_api, args.density)
+        data = json.dumps(collected, ensure_ascii=False).encode("utf-8")
+        atomic_write(args.crawl, lambda f: f.write(data))
+        print(f"📁 原始資料已儲存到: {args.crawl}")
+        return
+
+    planner = CoveragePlanner(polygon, args.density)
+
+    for endpoint in (SEVEN_ELEVEN_ENDPOINT, FAMILY_MART_ENDPOINT):
+        radius = estimator.radius(endpoint)
+        centers = planner.plan(radius)
+        print(f"\n{endpoint}: 有效半徑 {radius:.0f} 公尺，需要 {len(centers)} 次查詢")
+        for lat, lon in centers:
+            print(f"   {lat:.7f}, {lon:.7f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+限時搜尋模組
+在期限內回傳目前已取得的結果 (例如只有門市清單、還沒有商品明細或地址)，
+並標示每間門市的完整程度；期限後仍在進行的請求會在背景完成並寫入回應快取。
+背景請求使用 daemon 執行緒，程式結束時不會等待；設定 config.json 的 cache 後，
+結束前已完成的請求會保存下來供下次執行使用；未設定時只保存在行程內的記憶體快取
+"""
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from seven_eleven import SevenElevenAPI
+from family_mart import FamilyMartAPI
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+
+
+BRAND_NAMES = {"seven_eleven": "7-11", "family_mart": "全家"}
+
+# 同時進行的背景請求上限
+MAX_FETCHES = 16
+_fetch_slots = threading.BoundedSemaphore(MAX_FETCHES)
+
+# 未設定 cache 時，期限後完成的請求寫入這個行程內共用的快取
+_background_cache = ResponseCache()
+
+
+def _submit(func: Callable[..., Any], *args: Any) -> Future:
+    """
+    在 daemon 執行緒中執行請求
+
+    ThreadPoolExecutor 的執行緒會在直譯器結束時被 join，期限到了程式仍須等待所有請求完成；
+    daemon 執行緒則讓 CLI 在期限後即可結束
+    """
+    future: Future = Future()
+
+    def run():
+        with _fetch_slots:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, name="cvs-fetch", daemon=True).start()
+    return future
+
+
+def _fetch_seven_eleven(
+    api: SevenElevenAPI,
+    latitude: float,
+    longitude: float,
+    max_distance: float,
+    max_stores: int
+) -> List[Tuple[Dict[str, Any], Future, Future]]:
+    """
+    取得 7-11 門市清單，並立即排入每間門市的明細與地址請求
+
+    明細與地址在這個工作內排入，即使清單在期限之後才回來也會繼續暖快取
+    """
+    api.get_access_token()
+    stores = api.get_nearby_stores(latitude, longitude, max_distance)
+
+    fetches = []
+    for store in stores[:max_stores]:
+        store_info = api.build_store_summary(store)
+        detail = _submit(api.get_store_detail, store_info["store_no"], latitude, longitude)
+        address = _submit(api.get_store_by_name, store.get("StoreName", ""))
+        fetches.append((store_info, detail, address))
+    return fetches
+
+
+def _fetch_family_mart(
+    api: FamilyMartAPI,
+    latitude: float,
+    longitude: float,
+    max_distance: float,
+    max_stores: int
+) -> List[Dict[str, Any]]:
+    """取得全家門市（清單本身即包含商品明細）"""
+    stores = api.get_nearby_stores(latitude, longitude, max_distance)
+    # build_store_info 的結果由解析快取共用，複製後再加上 completeness
+    return [
+        dict(api.build_store_info(store), completeness={"items": True, "address": True})
+        for store in stores[:max_stores]
+    ]
+
+
+def _remaining(end: float) -> float:
+    return max(0.0, end - time.monotonic())
+
+
+def search_with_deadline(
+    config: Dict[str, Any],
+    deadline_seconds: float,
+    rate_limiter: Optional[RateLimiter] = None,
+    cache: Optional[ResponseCache] = None
+) -> Dict[str, Any]:
+    """
+    在期限內搜尋兩家品牌的即期品
+
+    Args:
+        config: 設定檔內容
+        deadline_seconds: 期限秒數
+        rate_limiter: 共用的速率限制器
+        cache: 明細與地址的回應快取，期限後完成的請求也會寫入；None 表示使用行程內的記憶體快取
+
+    Returns:
+        {"seven_eleven": [...], "family_mart": [...], "complete": 是否全部完成且沒有失敗,
+         "pending_fetches": 期限到時仍在進行的請求數,
+         "brands": {"7-11": "ok" | "failed" | "pending", ...} 各品牌門市清單的狀態}
+        每間門市附有 completeness: {"items": bool, "address": bool}
+    """
+    end = time.monotonic() + deadline_seconds
+    latitude = config["location"]["latitude"]
+    longitude = config["location"]["longitude"]
+    max_distance = config["search"]["max_distance_meters"]
+    max_stores = config["search"]["max_stores"]
+    if cache is None:
+        cache = _background_cache
+
+    lists: Dict[str, Future] = {}
+    if config["seven_eleven"]["enabled"]:
+        api = SevenElevenAPI(config["seven_eleven"]["mid_v"], rate_limiter, cache=cache)
+        lists["seven_eleven"] = _submit(
+            _fetch_seven_eleven, api, latitude, longitude, max_distance, max_stores
+        )
+    if config["family_mart"]["enabled"]:
+        api = FamilyMartAPI(config["family_mart"]["project_code"], rate_limiter)
+        lists["family_mart"] = _submit(
+            _fetch_family_mart, api, latitude, longitude, max_distance, max_stores
+        )
+
+    wait(list(lists.values()), timeout=_remaining(end))
+
+    output: Dict[str, Any] = {
+        "seven_eleven": [], "family_mart": [], "complete": True, "pending_fetches": 0, "brands": {}
+    }
+
+    for brand, future in lists.items():
+        if not future.done():
+            print(f"   ⏱️  {BRAND_NAMES[brand]} 門市清單尚未回傳")
+            output["brands"][BRAND_NAMES[brand]] = "pending"
+            output["complete"] = False
+            output["pending_fetches"] += 1
+        elif future.exception():
+            print(f"   ❌ {BRAND_NAMES[brand]} 搜尋失敗: {future.exception()}")
+            output["brands"][BRAND_NAMES[brand]] = "failed"
+            output["complete"] = False
+        else:
+            output["brands"][BRAND_NAMES[brand]] = "ok"
+
+    family_mart = lists.get("family_mart")
+    if family_mart and family_mart.done() and not family_mart.exception():
+        output["family_mart"] = family_mart.result()
+
+    seven_eleven = lists.get("seven_eleven")
+    if seven_eleven and seven_eleven.done() and not seven_eleven.exception():
+        fetches = seven_eleven.result()
+        wait([f for _, detail, address in fetches for f in (detail, address)], timeout=_remaining(end))
+
+        for store_info, detail, address in fetches:
+            completeness = {"items": False, "address": False}
+
+            # 無法取得詳情或地址就跳過，與 search_expired_food 相同
+            if detail.done():
+                if not detail.exception():
+                    SevenElevenAPI.apply_store_detail(store_info, detail.result())
+                    completeness["items"] = True
+            else:
+                output["pending_fetches"] += 1
+
+            if address.done():
+                if not address.exception():
+                    SevenElevenAPI.apply_store_address(store_info, address.result())
+                    completeness["address"] = True
+            else:
+                output["pending_fetches"] += 1
+
+            store_info["completeness"] = completeness
+            output["seven_eleven"].append(store_info)
+
+    if output["pending_fetches"]:
+        output["complete"] = False
+
+    return output
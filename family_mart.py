@@ -5,6 +5,9 @@ import requests
 import math
 from typing import Optional, List, Dict, Any
 
+from rate_limiter import RateLimiter, INTERACTIVE
+from parse_memo import store_memo
+
 
 class FamilyMartAPI:
     """全家便利商店即期品 API"""
@@ -16,14 +19,23 @@ class FamilyMartAPI:
         "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
     }
     
-    def __init__(self, project_code: str = "202106302"):
+    def __init__(
+        self,
+        project_code: str = "202106302",
+        rate_limiter: Optional[RateLimiter] = None,
+        priority: str = INTERACTIVE
+    ):
         """
         初始化全家 API
         
         Args:
             project_code: 專案代碼
+            rate_limiter: 共用的速率限制器，None 表示不限制
+            priority: 請求優先權 (interactive / background)
         """
         self.project_code = project_code
+        self.rate_limiter = rate_limiter
+        self.priority = priority
     
     @staticmethod
     def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -70,6 +82,9 @@ class FamilyMartAPI:
             "Longitude": longitude
         }
         
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url, self.priority)
+        
         response = requests.post(url, json=payload, headers=self.HEADERS)
         response.raise_for_status()
         
@@ -115,6 +130,75 @@ class FamilyMartAPI:
         
         return nearby_stores
     
+    def build_store_info(self, store: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        將 MapProductInfo 的門市資料整理成統一格式
+        
+        門市原始資料與上次相同時直接回傳上次整理好的結果（共用物件，不可修改）
+        
+        Args:
+            store: get_nearby_stores 回傳的單一門市（需有 calculated_distance）
+            
+        Returns:
+            門市資訊
+        """
+        return store_memo.get_or_build(
+            "全家", store.get("oldPKey", ""), store, lambda: self.parse_store_info(store)
+        )
+    
+    @staticmethod
+    def parse_store_info(store: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        解析 MapProductInfo 的門市資料（info → categories → products）
+        
+        Args:
+            store: get_nearby_stores 回傳的單一門市（需有 calculated_distance）
+            
+        Returns:
+            門市資訊
+        """
+        store_name = store.get("name", "")
+        address = store.get("address", "")
+        tel = store.get("tel", "")
+        distance = store.get("calculated_distance", 0)
+        info = store.get("info", [])
+        
+        store_info = {
+            "brand": "全家",
+            "store_no": store.get("oldPKey", ""),
+            "store_name": store_name,
+            "address": address,
+            "tel": tel,
+            "distance": round(distance, 2),
+            "latitude": store.get("latitude"),
+            "longitude": store.get("longitude"),
+            "total_qty": sum(cat.get("qty", 0) for cat in info),
+            "categories": [],
+            "items": []
+        }
+        
+        # 解析商品資訊
+        for category in info:
+            cat_name = category.get("name", "")
+            cat_qty = category.get("qty", 0)
+        
+            store_info["categories"].append({
+                "name": cat_name,
+                "qty": cat_qty
+            })
+        
+            # 取得商品詳情
+            for sub_cat in category.get("categories", []):
+                for product in sub_cat.get("products", []):
+                    store_info["items"].append({
+                        "name": product.get("name", ""),
+                        "qty": product.get("qty", 0),
+                        "category": cat_name,
+                        "sub_category": sub_cat.get("name", "")
+                    })
+        
+        return store_info
+    
     def search_expired_food(
         self,
         latitude: float,
@@ -138,45 +222,7 @@ class FamilyMartAPI:
         
         results = []
         for store in stores[:max_stores]:
-            store_name = store.get("name", "")
-            address = store.get("address", "")
-            tel = store.get("tel", "")
-            distance = store.get("calculated_distance", 0)
-            info = store.get("info", [])
-            
-            store_info = {
-                "brand": "全家",
-                "store_no": store.get("oldPKey", ""),
-                "store_name": store_name,
-                "address": address,
-                "tel": tel,
-                "distance": round(distance, 2),
-                "total_qty": sum(cat.get("qty", 0) for cat in info),
-                "categories": [],
-                "items": []
-            }
-            
-            # 解析商品資訊
-            for category in info:
-                cat_name = category.get("name", "")
-                cat_qty = category.get("qty", 0)
-                
-                store_info["categories"].append({
-                    "name": cat_name,
-                    "qty": cat_qty
-                })
-                
-                # 取得商品詳情
-                for sub_cat in category.get("categories", []):
-                    for product in sub_cat.get("products", []):
-                        store_info["items"].append({
-                            "name": product.get("name", ""),
-                            "qty": product.get("qty", 0),
-                            "category": cat_name,
-                            "sub_category": sub_cat.get("name", "")
-                        })
-            
-            results.append(store_info)
+            results.append(self.build_store_info(store))
         
         return results
 
@@ -186,7 +232,9 @@ def search_family_mart(
     longitude: float,
     max_distance: float = 1000,
     max_stores: int = 10,
-    project_code: str = "202106302"
+    project_code: str = "202106302",
+    rate_limiter: Optional[RateLimiter] = None,
+    priority: str = INTERACTIVE
 ) -> List[Dict[str, Any]]:
     """
     搜尋全家即期品的便利函數
@@ -197,11 +245,13 @@ def search_family_mart(
         max_distance: 最大距離（公尺）
         max_stores: 最多回傳幾間店
         project_code: 專案代碼
+        rate_limiter: 共用的速率限制器
+        priority: 請求優先權
         
     Returns:
         包含門市和商品資訊的清單
     """
-    api = FamilyMartAPI(project_code)
+    api = FamilyMartAPI(project_code, rate_limiter, priority)
     return api.search_expired_food(
         latitude, longitude, max_distance, max_stores
     )
@@ -0,0 +1,412 @@
+"""
+跨門市商品全文索引模組
+以字元 bigram 建立倒排索引，支援全形 / 半形正規化、距離與數量條件，
+新的搜尋結果進來時只更新有變動的門市
+"""
+import argparse
+import json
+import re
+import unicodedata
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+from family_mart import FamilyMartAPI
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形 (NFKC) 並轉小寫"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x3400 <= code <= 0x4DBF
+        or 0x4E00 <= code <= 0x9FFF
+        or 0xF900 <= code <= 0xFAFF
+        or 0x3040 <= code <= 0x30FF
+        or 0x20000 <= code <= 0x2FA1F
+    )
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    將文字切成索引用的 token
+
+    CJK 連續字元與英數字連續字元分別切成 bigram (單一字元則保留單字)，
+    因此「ore」也能找到「OREO巧克力餅乾」
+
+    Args:
+        text: 原始文字
+
+    Returns:
+        token 清單（可能重複）
+    """
+    tokens = []
+    run: List[str] = []
+    run_is_cjk = False
+
+    def flush():
+        if len(run) == 1:
+            tokens.append(run[0])
+        else:
+            tokens.extend(run[i] + run[i + 1] for i in range(len(run) - 1))
+        run.clear()
+
+    for char in normalize_text(text):
+        if _is_cjk(char) or char.isalnum():
+            is_cjk = _is_cjk(char)
+            if run and is_cjk != run_is_cjk:
+                flush()
+            run_is_cjk = is_cjk
+            run.append(char)
+        elif run:
+            flush()
+
+    if run:
+        flush()
+
+    return tokens
+
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """
+    解析查詢字串
+
+    支援「飯糰 within 500 m qty >= 2」這類寫法，
+    也可寫成「飯糰 500m內 數量≥2」；數量條件可用 >=、≥、=>、>
+
+    Args:
+        query: 查詢字串
+
+    Returns:
+        {"text": 關鍵字, "within": 距離或 None, "min_qty": 最少數量}
+
+    Raises:
+        ValueError: 有無法解析的 within / qty 條件（避免被當成關鍵字而查不到任何商品）
+    """
+    text = normalize_text(query)
+    within = None
+    min_qty = 1
+
+    match = re.search(r"within\s*(\d+(?:\.\d+)?)\s*(?:m\b|公尺)?|(\d+(?:\.\d+)?)\s*(?:m|公尺)\s*內", text)
+    if match:
+        within = float(match.group(1) or match.group(2))
+        text = text[:match.start()] + " " + text[match.end():]
+
+    match = re.search(r"(?:with\s+)?(?:qty|數量)\s*(>=|≥|=>|>)\s*(\d+)", text)
+    if match:
+        min_qty = int(match.group(2)) + (1 if match.group(1) == ">" else 0)
+        text = text[:match.start()] + " " + text[match.end():]
+
+    leftover = re.search(r"\b(?:within|qty)\b|數量", text)
+    if leftover:
+        raise ValueError(f"無法解析的查詢條件: {query}")
+
+    return {"text": " ".join(text.split()), "within": within, "min_qty": min_qty}
+
+
+class ItemIndex:
+    """
+    商品倒排索引
+
+    以 (品牌, 店號) 作為門市鍵值，每個商品為一筆文件；
+    update_stores 會比對門市商品內容，只重建有變動的門市
+    """
+
+    def __init__(self):
+        self.stores: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.docs: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self._store_docs: Dict[Tuple[str, str], List[int]] = {}
+        self._store_signatures: Dict[Tuple[str, str], Tuple] = {}
+        self._next_doc_id = 0
+
+    @staticmethod
+    def store_key(store: Dict[str, Any]) -> Tuple[str, str]:
+        return (store.get("brand", ""), str(store.get("store_no", "")))
+
+    def remove_store(self, key: Tuple[str, str]):
+        """移除門市與其所有商品"""
+        for doc_id in self._store_docs.pop(key, []):
+            doc = self.docs.pop(doc_id)
+            for token in doc["tokens"]:
+                posting = self.postings.get(token)
+                if posting is not None:
+                    posting.discard(doc_id)
+                    if not posting:
+                        del self.postings[token]
+        self.stores.pop(key, None)
+        self._store_signatures.pop(key, None)
+
+    def update_stores(self, stores: List[Dict[str, Any]]) -> int:
+        """
+        加入或更新門市
+
+        Args:
+            stores: search_expired_food 格式的門市清單
+
+        Returns:
+            實際重建索引的門市數
+        """
+        changed = 0
+        for store in stores:
+            key = self.store_key(store)
+            items = store.get("items", [])
+            signature = tuple(
+                (item.get("name", ""), item.get("qty", 0), item.get("category", ""))
+                for item in items
+            )
+
+            meta = {
+                "brand": store.get("brand", ""),
+                "store_no": store.get("store_no", ""),
+                "store_name": store.get("store_name", ""),
+                "distance": store.get("distance"),
+                "latitude": store.get("latitude"),
+                "longitude": store.get("longitude"),
+            }
+
+            if self._store_signatures.get(key) == signature:
+                self.stores[key] = meta
+                continue
+
+            self.remove_store(key)
+            self.stores[key] = meta
+            self._store_signatures[key] = signature
+
+            doc_ids = []
+            for item in items:
+                doc_id = self._next_doc_id
+                self._next_doc_id += 1
+
+                name = item.get("name", "")
+                tokens = set(tokenize(name))
+                self.docs[doc_id] = {
+                    "store": key,
+                    "name": name,
+                    "normalized": normalize_text(name),
+                    "qty": item.get("qty", 0),
+                    "category": item.get("category", ""),
+                    "tokens": tokens,
+                }
+                for token in tokens:
+                    self.postings.setdefault(token, set()).add(doc_id)
+                doc_ids.append(doc_id)
+
+            self._store_docs[key] = doc_ids
+            changed += 1
+
+        return changed
+
+    @staticmethod
+    def snapshot_radii(results: Dict[str, Any]) -> Dict[str, float]:
+        """
+        取得一次搜尋結果中，各品牌確定沒有遺漏門市的半徑（公尺）
+
+        只包含確實回傳清單的品牌：結果未完成 (complete 為 false) 時回傳空 dict；
+        有 brands 狀態時只取 "ok" 的品牌，舊結果則只取有出現門市的品牌。
+        一般搜尋為 max_distance_meters，但門市數達到 max_stores 時清單被截斷，
+        只確定到最遠的門市；最近 K 間模式只確定到第 K 近的門市
+
+        Args:
+            results: search_all_stores 的回傳結果
+
+        Returns:
+            {品牌: 半徑}
+        """
+        if not results.get("complete", True):
+            return {}
+
+        settings = results.get("search_settings", {})
+        stores = results.get("all_stores", [])
+        by_brand: Dict[str, List[Dict[str, Any]]] = {}
+        for store in stores:
+            by_brand.setdefault(store.get("brand", ""), []).append(store)
+
+        statuses = results.get("brands")
+        if statuses is not None:
+            brands = [brand for brand, status in statuses.items() if status == "ok"]
+        else:
+            brands = list(by_brand)
+
+        k_nearest = settings.get("k_nearest")
+        if k_nearest:
+            distances = [s["distance"] for s in stores if s.get("distance") is not None]
+            if len(stores) < k_nearest or not distances:
+                return {}
+            return {brand: max(distances) for brand in brands}
+
+        radius = settings.get("max_distance_meters")
+        if radius is None:
+            return {}
+
+        max_stores = settings.get("max_stores")
+        radii = {}
+        for brand in brands:
+            returned = by_brand.get(brand, [])
+            if max_stores and len(returned) >= max_stores:
+                distances = [s["distance"] for s in returned if s.get("distance") is not None]
+                if not distances:
+                    continue
+                radii[brand] = min(radius, max(distances))
+            else:
+                radii[brand] = radius
+        return radii
+
+    def update_snapshot(self, results: Dict[str, Any], prune: Optional[bool] = None) -> int:
+        """
+        以一次搜尋結果更新索引
+
+        上游只回傳仍有即期品的門市，門市賣完後就不會出現在結果中，
+        因此預設會移除位於這次搜尋確定涵蓋範圍內、但沒有出現在結果中的門市
+        （範圍見 snapshot_radii；沒有座標的門市無法判斷位置，一律保留）
+
+        Args:
+            results: search_all_stores 的回傳結果
+            prune: True 表示移除所有沒有出現的門市，False 表示都保留，
+                None 表示只移除這次搜尋確定涵蓋範圍內沒有出現的門市
+
+        Returns:
+            實際重建索引的門市數
+        """
+        stores = results.get("all_stores", [])
+        if prune is not False:
+            present = {self.store_key(s) for s in stores}
+            missing = [k for k in self.stores if k not in present]
+
+            location = results.get("location", {})
+            radii = self.snapshot_radii(results) if prune is None else {}
+            for key in missing:
+                if prune is None:
+                    meta = self.stores[key]
+                    radius = radii.get(meta["brand"])
+                    if radius is None or not location:
+                        continue
+                    if not (meta.get("latitude") and meta.get("longitude")):
+                        continue
+                    distance = FamilyMartAPI.calculate_distance(
+                        location["latitude"], location["longitude"],
+                        meta["latitude"], meta["longitude"]
+                    )
+                    if distance > radius:
+                        continue
+                self.remove_store(key)
+        return self.update_stores(stores)
+
+    def _posting(self, token: str) -> Set[int]:
+        if len(token) == 1:
+            # 單一字元大多只出現在 bigram 中，合併所有包含該字的 token
+            result: Set[int] = set()
+            for key, posting in self.postings.items():
+                if token in key:
+                    result |= posting
+            return result
+        return self.postings.get(token, set())
+
+    def _candidate_docs(self, text: str) -> Set[int]:
+        tokens = set(tokenize(text))
+        if not tokens:
+            return set(self.docs)
+
+        postings = sorted((self._posting(t) for t in tokens), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    def search(
+        self,
+        text: str,
+        within: Optional[float] = None,
+        min_qty: int = 1,
+        near: Optional[Tuple[float, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        搜尋商品
+
+        Args:
+            text: 關鍵字，多個關鍵字以空白分隔且必須全部符合
+            within: 距離上限（公尺），None 表示不限制
+            min_qty: 最少數量
+            near: 計算距離的位置 (lat, lon)，None 表示使用結果中的 distance
+
+        Returns:
+            符合的商品清單，依距離排序
+        """
+        keywords = [normalize_text(k) for k in text.split()]
+
+        candidates = None
+        for keyword in keywords:
+            docs = self._candidate_docs(keyword)
+            candidates = docs if candidates is None else candidates & docs
+        if candidates is None:
+            candidates = set(self.docs)
+
+        matches = []
+        for doc_id in candidates:
+            doc = self.docs[doc_id]
+            # bigram 交集可能誤判，最後以子字串確認
+            if not all(keyword in doc["normalized"] for keyword in keywords):
+                continue
+            if doc["qty"] < min_qty:
+                continue
+
+            store = self.stores[doc["store"]]
+            distance = store.get("distance")
+            if near and store.get("latitude") and store.get("longitude"):
+                distance = FamilyMartAPI.calculate_distance(
+                    near[0], near[1], store["latitude"], store["longitude"]
+                )
+            if within is not None and (distance is None or distance > within):
+                continue
+
+            matches.append({
+                "brand": store["brand"],
+                "store_no": store["store_no"],
+                "store_name": store["store_name"],
+                "distance": round(distance, 2) if distance is not None else None,
+                "name": doc["name"],
+                "qty": doc["qty"],
+                "category": doc["category"],
+            })
+
+        matches.sort(key=lambda x: (x["distance"] if x["distance"] is not None else float('inf'), x["name"]))
+        return matches
+
+    def query(self, query: str, near: Optional[Tuple[float, float]] = None) -> List[Dict[str, Any]]:
+        """以 parse_query 支援的查詢字串搜尋"""
+        parsed = parse_query(query)
+        return self.search(parsed["text"], parsed["within"], parsed["min_qty"], near)
+
+
+def main():
+    """從搜尋結果檔建立索引並查詢"""
+    parser = argparse.ArgumentParser(description="搜尋即期品商品")
+    parser.add_argument("query", help="例如: \"飯糰 within 500 m qty >= 2\"")
+    parser.add_argument("--results", default="expired_food_results.json", help="搜尋結果 JSON 檔")
+    args = parser.parse_args()
+
+    with open(args.results, "r", encoding="utf-8") as f:
+        results = json.load(f)
+
+    index = ItemIndex()
+    index.update_snapshot(results)
+
+    try:
+        matches = index.query(args.query)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    if not matches:
+        print("😢 沒有找到符合的商品")
+        return
+
+    for match in matches:
+        distance = f"{match['distance']:.0f} 公尺" if match["distance"] is not None else "距離未知"
+        print(f"【{match['brand']}】{match['store_name']} ({distance}) - {match['name']}: {match['qty']} 個")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,21 @@
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import Optional, List, Dict, Any
 
-from seven_eleven import search_seven_eleven
-from family_mart import search_family_mart
+from seven_eleven import SevenElevenAPI, search_seven_eleven
+from family_mart import FamilyMartAPI, search_family_mart
+from coverage_planner import RadiusEstimator
+from nearest_search import search_k_nearest
+from deadline_search import search_with_deadline
+from output_sinks import build_sinks
+from rate_limiter import build_rate_limiter
+from response_cache import build_response_cache
+from route_planner import plan_route, print_route
+from notifier import build_dispatcher
+from parse_memo import store_memo
+from tile_export import export_tiles, DEFAULT_ZOOMS
+from item_index import ItemIndex
 
 
 def load_config(config_path: str = "config.json") -> Dict[str, Any]:
@@ -17,12 +28,19 @@ def load_config(config_path: str = "config.json") -> Dict[str, Any]:
         return json.load(f)
 
 
-def search_all_stores(config: Dict[str, Any]) -> Dict[str, Any]:
+def search_all_stores(
+    config: Dict[str, Any],
+    deadline: Optional[float] = None,
+    config_dir: str = ""
+) -> Dict[str, Any]:
     """
     搜尋所有便利商店的即期品
     
     Args:
         config: 設定檔內容
+        deadline: 期限秒數，到期時回傳目前已取得的結果；None 表示使用
+            config["search"]["deadline_seconds"]，仍未設定則等待全部完成
+        config_dir: 設定檔所在目錄，速率限制、快取等共用狀態檔的相對路徑以此為準
         
     Returns:
         搜尋結果
@@ -31,6 +49,8 @@ def search_all_stores(config: Dict[str, Any]) -> Dict[str, Any]:
     longitude = config["location"]["longitude"]
     max_distance = config["search"]["max_distance_meters"]
     max_stores = config["search"]["max_stores"]
+    rate_limiter = build_rate_limiter(config.get("rate_limit"), config_dir)
+    cache = build_response_cache(config.get("cache"), config_dir)
     
     results = {
         "query_time": datetime.now().isoformat(),
@@ -38,11 +58,65 @@ def search_all_stores(config: Dict[str, Any]) -> Dict[str, Any]:
         "search_settings": config["search"],
         "seven_eleven": [],
         "family_mart": [],
-        "all_stores": []
+        "all_stores": [],
+        # 各品牌的查詢狀態: "ok" / "failed" / "pending"（限時模式到期時仍在進行）
+        "brands": {}
     }
     
+    # K 間最近門市模式：由近到遠擴大範圍，直到找到 K 間有即期品的門市
+    k_nearest = config["search"].get("k_nearest")
+    if k_nearest:
+        print(f"\n🔍 搜尋最近 {k_nearest} 間有即期品的門市...")
+        seven_eleven_api = None
+        if config["seven_eleven"]["enabled"]:
+            seven_eleven_api = SevenElevenAPI(config["seven_eleven"]["mid_v"], rate_limiter, cache=cache)
+        family_mart_api = None
+        if config["family_mart"]["enabled"]:
+            family_mart_api = FamilyMartAPI(config["family_mart"]["project_code"], rate_limiter)
+        
+        try:
+            stores = search_k_nearest(
+                latitude,
+                longitude,
+                k_nearest,
+                seven_eleven_api=seven_eleven_api,
+                family_mart_api=family_mart_api,
+                estimator=RadiusEstimator(
+                    os.path.join(config_dir, config["search"].get("radius_file", ".coverage_radius.json"))
+                ),
+                max_radius=config["search"].get("k_nearest_max_radius", 3000)
+            )
+            results["seven_eleven"] = [s for s in stores if s["brand"] == "7-11"]
+            results["family_mart"] = [s for s in stores if s["brand"] == "全家"]
+            results["all_stores"] = stores
+            status = "ok"
+            print(f"   ✅ 找到 {len(stores)} 間有即期品")
+        except Exception as e:
+            status = "failed"
+            print(f"   ❌ 搜尋失敗: {e}")
+        if seven_eleven_api:
+            results["brands"]["7-11"] = status
+        if family_mart_api:
+            results["brands"]["全家"] = status
+    
+    # 限時模式：到期時回傳已取得的部分結果，其餘請求在背景完成
+    if deadline is None:
+        deadline = config["search"].get("deadline_seconds")
+    if deadline and not k_nearest:
+        print(f"\n🔍 限時 {deadline} 秒搜尋即期品...")
+        partial = search_with_deadline(config, deadline, rate_limiter, cache)
+        results["seven_eleven"] = partial["seven_eleven"]
+        results["family_mart"] = partial["family_mart"]
+        results["all_stores"] = partial["seven_eleven"] + partial["family_mart"]
+        results["complete"] = partial["complete"]
+        results["brands"] = partial["brands"]
+        if not partial["pending_fetches"]:
+            print(f"   ✅ 找到 {len(results['all_stores'])} 間有即期品")
+        else:
+            print(f"   ⏱️  時間到，先回傳 {len(results['all_stores'])} 間門市（{partial['pending_fetches']} 個請求仍在背景進行）")
+    
     # 搜尋 7-11
-    if config["seven_eleven"]["enabled"]:
+    if config["seven_eleven"]["enabled"] and not k_nearest and not deadline:
         print("\n🔍 搜尋 7-11 即期品 (i珍食)...")
         try:
             seven_eleven_results = search_seven_eleven(
@@ -50,16 +124,20 @@ def search_all_stores(config: Dict[str, Any]) -> Dict[str, Any]:
                 longitude=longitude,
                 max_distance=max_distance,
                 max_stores=max_stores,
-                mid_v=config["seven_eleven"]["mid_v"]
+                mid_v=config["seven_eleven"]["mid_v"],
+                rate_limiter=rate_limiter,
+                cache=cache
             )
             results["seven_eleven"] = seven_eleven_results
             results["all_stores"].extend(seven_eleven_results)
+            results["brands"]["7-11"] = "ok"
             print(f"   ✅ 找到 {len(seven_eleven_results)} 間 7-11 有即期品")
         except Exception as e:
+            results["brands"]["7-11"] = "failed"
             print(f"   ❌ 7-11 搜尋失敗: {e}")
     
     # 搜尋全家
-    if config["family_mart"]["enabled"]:
+    if config["family_mart"]["enabled"] and not k_nearest and not deadline:
         print("\n🔍 搜尋全家即期品 (友善食光)...")
         try:
             family_mart_results = search_family_mart(
@@ -67,17 +145,25 @@ def search_all_stores(config: Dict[str, Any]) -> Dict[str, Any]:
                 longitude=longitude,
                 max_distance=max_distance,
                 max_stores=max_stores,
-                project_code=config["family_mart"]["project_code"]
+                project_code=config["family_mart"]["project_code"],
+                rate_limiter=rate_limiter
             )
             results["family_mart"] = family_mart_results
             results["all_stores"].extend(family_mart_results)
+            results["brands"]["全家"] = "ok"
             print(f"   ✅ 找到 {len(family_mart_results)} 間全家有即期品")
         except Exception as e:
+            results["brands"]["全家"] = "failed"
             print(f"   ❌ 全家搜尋失敗: {e}")
     
     # 依距離排序所有門市
     results["all_stores"].sort(key=lambda x: x.get("distance", float('inf')))
     
+    if rate_limiter:
+        results["rate_limit_metrics"] = rate_limiter.get_metrics()
+    
+    results["parse_memo_metrics"] = store_memo.get_metrics()
+    
     return results
 
 
@@ -109,6 +195,9 @@ def print_results(results: Dict[str, Any]):
         
         print(f"{i}. 【{brand}】{name}")
         print(f"   距離: {distance:.0f} 公尺 | 即期品: {total_qty} 項")
+        completeness = store.get("completeness", {})
+        if not completeness.get("items", True):
+            print("   ⏱️  商品明細尚未取得")
         if address:
             print(f"   地址: {address}")
         
@@ -134,49 +223,9 @@ def save_results(results: Dict[str, Any], config: Dict[str, Any]):
     """儲存搜尋結果"""
     output_config = config.get("output", {})
     
-    # 儲存 JSON
-    if output_config.get("save_json", True):
-        json_file = output_config.get("json_file", "expired_food_results.json")
-        with open(json_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        print(f"📁 JSON 結果已儲存到: {json_file}")
-    
-    # 儲存文字報告
-    if output_config.get("save_txt", True):
-        txt_file = output_config.get("txt_file", "expired_food_report.txt")
-        with open(txt_file, "w", encoding="utf-8") as f:
-            f.write("=" * 80 + "\n")
-            f.write("便利商店即期品搜尋報告\n")
-            f.write("=" * 80 + "\n\n")
-            
-            location = results["location"]
-            f.write(f"位置: {location.get('description', '')} ({location['latitude']}, {location['longitude']})\n")
-            f.write(f"搜尋範圍: {results['search_settings']['max_distance_meters']} 公尺內\n")
-            f.write(f"查詢時間: {results['query_time']}\n\n")
-            
-            f.write("-" * 80 + "\n")
-            
-            for i, store in enumerate(results["all_stores"], 1):
-                brand = store.get("brand", "")
-                name = store.get("store_name", "")
-                distance = store.get("distance", 0)
-                total_qty = store.get("total_qty", 0)
-                address = store.get("address", "")
-                
-                f.write(f"\n{i}. 【{brand}】{name}\n")
-                f.write(f"   距離: {distance:.0f} 公尺 | 即期品: {total_qty} 項\n")
-                if address:
-                    f.write(f"   地址: {address}\n")
-                
-                items = store.get("items", [])
-                if items:
-                    f.write("   商品:\n")
-                    for item in items:
-                        f.write(f"     - {item['name']}: {item['qty']} 個\n")
-                
-                f.write("\n")
-        
-        print(f"📄 文字報告已儲存到: {txt_file}")
+    for sink in build_sinks(output_config):
+        sink.write(results)
+        print(f"📁 {sink.label}已儲存到: {sink.path}")
 
 
 def main():
@@ -187,18 +236,57 @@ def main():
     print("=" * 80)
     
     # 載入設定
-    config_path = os.path.join(os.path.dirname(__file__), "config.json")
+    config_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(config_dir, "config.json")
     config = load_config(config_path)
     
+    # 通知派送在背景執行，不阻塞搜尋
+    dispatcher = build_dispatcher(config.get("notify"), config_dir)
+    if dispatcher:
+        dispatcher.start()
+    
     # 搜尋
-    results = search_all_stores(config)
+    results = search_all_stores(config, config_dir=config_dir)
+    
+    if dispatcher:
+        queued = dispatcher.enqueue(results)
+        print(f"\n🔔 已排入 {queued} 則通知")
     
     # 顯示結果
     print_results(results)
     
+    # 規劃巡店路線
+    route_config = config.get("route", {})
+    if route_config.get("enabled", False):
+        results["route"] = plan_route(
+            results["all_stores"],
+            start=(config["location"]["latitude"], config["location"]["longitude"]),
+            wanted_items=route_config.get("wanted_items", []),
+            return_to_start=route_config.get("return_to_start", False)
+        )
+        print_route(results["route"])
+    
     # 儲存結果
     save_results(results, config)
     
+    # 匯出地圖圖磚
+    tiles_config = config.get("tiles", {})
+    if tiles_config.get("enabled", False):
+        stats = export_tiles(
+            results["all_stores"],
+            tiles_config.get("dir", "tiles"),
+            zooms=tiles_config.get("zooms", DEFAULT_ZOOMS),
+            generated_at=results["query_time"],
+            location=results["location"],
+            radii=ItemIndex.snapshot_radii(results)
+        )
+        print(f"🗺️  圖磚已更新: 重寫 {stats['written']}、未變動 {stats['unchanged']}、刪除 {stats['removed']}")
+    
+    if dispatcher:
+        if not dispatcher.flush(config["notify"].get("flush_timeout_seconds", 30)):
+            print(f"⏳ 尚有 {dispatcher.pending_count()} 則通知未送出，下次執行時會繼續")
+        dispatcher.stop()
+    
     print("\n✅ 搜尋完成！")
 
 
@@ -0,0 +1,257 @@
+"""
+K 間最近門市搜尋模組
+先以目前位置查詢一次，不足 K 間時才在外圈補查，
+並且只對最後選出的 K 間門市取得商品明細
+"""
+import math
+from typing import Optional, List, Dict, Any, Tuple
+
+from seven_eleven import SevenElevenAPI
+from family_mart import FamilyMartAPI
+from coverage_planner import (
+    LocalProjection, RadiusEstimator, SEVEN_ELEVEN_ENDPOINT, FAMILY_MART_ENDPOINT
+)
+
+
+MIN_RING_SIZE = 6  # 每圈最少的查詢中心數（正六邊形）
+
+# 相鄰查詢中心間距的一半不超過有效半徑的這個比例，確保外圈之間沒有縫隙
+RING_OVERLAP = 0.7
+
+
+def ring_size(distance: float, reach: float) -> int:
+    """
+    計算一圈需要的查詢中心數
+
+    Args:
+        distance: 查詢中心與目前位置的距離（公尺）
+        reach: 每個查詢中心的有效半徑（公尺）
+
+    Returns:
+        查詢中心數
+    """
+    ratio = RING_OVERLAP * reach / distance if distance > 0 else 1.0
+    if ratio >= 1:
+        return MIN_RING_SIZE
+    return max(MIN_RING_SIZE, math.ceil(math.pi / math.asin(ratio)))
+
+
+def ring_centers(
+    latitude: float,
+    longitude: float,
+    distance: float,
+    count: int
+) -> List[Tuple[float, float]]:
+    """
+    取得以目前位置為圓心、距離 distance 的一圈查詢中心
+
+    Args:
+        latitude: 緯度
+        longitude: 經度
+        distance: 查詢中心與目前位置的距離（公尺）
+        count: 查詢中心數
+
+    Returns:
+        (lat, lon) 清單
+    """
+    projection = LocalProjection(latitude, longitude)
+    return [
+        projection.to_latlon(
+            distance * math.cos(2 * math.pi * i / count),
+            distance * math.sin(2 * math.pi * i / count)
+        )
+        for i in range(count)
+    ]
+
+
+def ring_coverage(complete: float, distance: float, reach: float, count: int) -> float:
+    """
+    計算補查一圈後可確定沒有遺漏門市的半徑
+
+    圓上任一點與最近的查詢中心夾角不超過 pi / count，
+    因此外圈可確保涵蓋到 distance * cos + sqrt(reach^2 - (distance * sin)^2)
+
+    Args:
+        complete: 目前已確定的半徑（公尺）
+        distance: 查詢中心與目前位置的距離（公尺）
+        reach: 每個查詢中心的有效半徑（公尺）
+        count: 查詢中心數
+
+    Returns:
+        補查後已確定的半徑（公尺）
+    """
+    half_angle = math.pi / count
+    offset = distance * math.sin(half_angle)
+    if reach <= offset:
+        return complete
+
+    spread = math.sqrt(reach * reach - offset * offset)
+    inner = distance * math.cos(half_angle) - spread
+    outer = distance * math.cos(half_angle) + spread
+
+    # 外圈與已確定範圍之間不能有縫隙
+    if inner > complete:
+        return complete
+    return max(complete, outer)
+
+
+class _BrandFrontier:
+    """單一品牌目前已知的門市與已確定沒有遺漏的半徑"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.stores: Dict[str, Tuple[float, bool, Dict[str, Any]]] = {}
+        self.complete = 0.0
+
+    def add(self, key: str, distance: float, qualifies: bool, raw: Dict[str, Any]):
+        if key not in self.stores or distance < self.stores[key][0]:
+            self.stores[key] = (distance, qualifies, raw)
+
+
+def _fetch_seven_eleven(
+    api: SevenElevenAPI,
+    frontier: _BrandFrontier,
+    latitude: float,
+    longitude: float,
+    center: Tuple[float, float]
+) -> List[float]:
+    """查詢 7-11 並回傳各門市與查詢中心的距離（無法得知時回傳空清單）"""
+    stores = api.get_nearby_store_list(latitude, longitude, center[0], center[1])
+
+    at_user = center == (latitude, longitude)
+    distances = []
+    for store in stores:
+        distance = store.get("Distance", float('inf'))
+        frontier.add(store.get("StoreNo", ""), distance, store.get("RemainingQty", 0) > 0, store)
+
+        if at_user:
+            distances.append(distance)
+        elif store.get("Latitude") and store.get("Longitude"):
+            distances.append(FamilyMartAPI.calculate_distance(
+                center[0], center[1], store["Latitude"], store["Longitude"]
+            ))
+    return distances
+
+
+def _fetch_family_mart(
+    api: FamilyMartAPI,
+    frontier: _BrandFrontier,
+    latitude: float,
+    longitude: float,
+    center: Tuple[float, float]
+) -> List[float]:
+    """查詢全家並回傳各門市與查詢中心的距離"""
+    stores = api.get_stores_by_coords(center[0], center[1])
+
+    distances = []
+    for store in stores:
+        store_lat = store.get("latitude", 0)
+        store_lon = store.get("longitude", 0)
+        if not (store_lat and store_lon):
+            continue
+
+        distance = FamilyMartAPI.calculate_distance(latitude, longitude, store_lat, store_lon)
+        qualifies = sum(cat.get("qty", 0) for cat in store.get("info", [])) > 0
+        frontier.add(store.get("oldPKey", ""), distance, qualifies, store)
+        distances.append(FamilyMartAPI.calculate_distance(center[0], center[1], store_lat, store_lon))
+    return distances
+
+
+def search_k_nearest(
+    latitude: float,
+    longitude: float,
+    k: int,
+    seven_eleven_api: Optional[SevenElevenAPI] = None,
+    family_mart_api: Optional[FamilyMartAPI] = None,
+    estimator: Optional[RadiusEstimator] = None,
+    max_radius: float = 3000
+) -> List[Dict[str, Any]]:
+    """
+    搜尋兩家品牌合計最近的 K 間有即期品門市
+
+    每個品牌先在目前位置查詢一次；若已確定的範圍內不足 K 間，
+    只對已確定半徑小於目前第 K 近距離的品牌補查外圈。
+    一旦所有品牌已確定的半徑都不小於第 K 近的距離就停止。
+
+    Args:
+        latitude: 緯度
+        longitude: 經度
+        k: 需要的門市數
+        seven_eleven_api: SevenElevenAPI 實例，None 表示略過
+        family_mart_api: FamilyMartAPI 實例，None 表示略過
+        estimator: 有效半徑估計器，用於安排外圈查詢
+        max_radius: 最大搜尋半徑（公尺）
+
+    Returns:
+        依距離排序的門市資訊清單（格式同 search_expired_food）
+    """
+    estimator = estimator or RadiusEstimator()
+    user = (latitude, longitude)
+
+    sources = []
+    if seven_eleven_api:
+        sources.append((_BrandFrontier(SEVEN_ELEVEN_ENDPOINT), seven_eleven_api, _fetch_seven_eleven))
+    if family_mart_api:
+        sources.append((_BrandFrontier(FAMILY_MART_ENDPOINT), family_mart_api, _fetch_family_mart))
+
+    # 第一圈：目前位置
+    for frontier, api, fetch in sources:
+        distances = fetch(api, frontier, latitude, longitude, user)
+        estimator.observe(frontier.endpoint, distances)
+        frontier.complete = max(distances) if distances else 0.0
+
+    def qualifying() -> List[Tuple[float, int, str]]:
+        found = []
+        for index, (frontier, _, _) in enumerate(sources):
+            for key, (distance, qualifies, _) in frontier.stores.items():
+                if qualifies and distance <= max_radius:
+                    found.append((distance, index, key))
+        found.sort()
+        return found
+
+    while True:
+        found = qualifying()
+        # 第 K 近的距離；不足 K 間時須確定到 max_radius
+        target = found[k - 1][0] if len(found) >= k else max_radius
+
+        pending = [s for s in sources if s[0].complete < target]
+        if not pending:
+            break
+
+        stalled = False
+        for frontier, api, fetch in pending:
+            reach = estimator.radius(frontier.endpoint)
+            # 外圈放在已確定範圍的邊界上
+            distance = frontier.complete if frontier.complete > 0 else reach
+            count = ring_size(distance, reach)
+
+            reaches = []
+            for center in ring_centers(latitude, longitude, distance, count):
+                ring_distances = fetch(api, frontier, latitude, longitude, center)
+                if ring_distances:
+                    estimator.observe(frontier.endpoint, ring_distances)
+                    reaches.append(max(ring_distances))
+
+            # 外圈查詢點附近沒有門市時（郊區），以估計半徑計算
+            ring_reach = min(reaches) if len(reaches) == count else reach
+            new_complete = ring_coverage(frontier.complete, distance, ring_reach, count)
+            if new_complete <= frontier.complete:
+                stalled = True
+            frontier.complete = new_complete
+
+        if stalled:
+            break
+
+    estimator.save()
+
+    results = []
+    for distance, index, key in qualifying()[:k]:
+        frontier, api, _ = sources[index]
+        raw = frontier.stores[key][2]
+        if isinstance(api, SevenElevenAPI):
+            results.append(api.build_store_info(raw, latitude, longitude))
+        else:
+            raw["calculated_distance"] = distance
+            results.append(api.build_store_info(raw))
+
+    return results
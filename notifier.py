@@ -0,0 +1,487 @@
+"""
+即期品到貨通知模組
+search_all_stores 之後比對各訂閱者關注的商品，依收件者批次整理、
+在冷卻時間內不重複通知同一 (門市, 商品)，並透過背景 worker 送出。
+待送通知保存在 SQLite outbox，程式重啟後會繼續送出。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, List, Dict, Any, Tuple
+
+import requests
+
+from item_index import ItemIndex
+
+
+CONSOLE = "console"
+WEBHOOK = "webhook"
+
+
+class AlertDispatcher:
+    """
+    批次通知派送器
+
+    enqueue() 只在 SQLite 中寫入 outbox，實際送出由背景執行緒上的
+    asyncio worker pool 負責，不會阻塞搜尋流程
+    """
+
+    # 重試間隔基準秒數，第 n 次重試等待 RETRY_BASE * 2^(n-1)
+    RETRY_BASE = 5.0
+
+    # 認領的批次超過 send_timeout + LEASE_GRACE 秒仍未完成，視為認領的行程已中止，
+    # 其他行程可以重新認領
+    LEASE_GRACE = 60.0
+
+    def __init__(
+        self,
+        subscribers: List[Dict[str, Any]],
+        outbox_path: str = ".notify_outbox.sqlite3",
+        cooldown_seconds: float = 3600,
+        workers: int = 8,
+        max_retries: int = 3,
+        send_timeout: float = 10
+    ):
+        """
+        初始化通知派送器
+
+        Args:
+            subscribers: 訂閱者清單，格式為
+                {"id": ..., "watch": [關鍵字], "within": 公尺, "min_qty": 數量,
+                 "channel": "webhook" | "console", "url": webhook 網址}
+            outbox_path: outbox SQLite 檔案路徑
+            cooldown_seconds: 同一收件者對同一 (門市, 商品) 的冷卻時間
+            workers: 同時送出的最大數量
+            max_retries: 失敗後最多重試幾次
+            send_timeout: 單次送出逾時秒數
+        """
+        self.subscribers = {str(s["id"]): s for s in subscribers}
+        self.outbox_path = outbox_path
+        self.cooldown_seconds = cooldown_seconds
+        self.workers = workers
+        self.max_retries = max_retries
+        self.send_timeout = send_timeout
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 依關鍵字分組訂閱者，相同關鍵字只查一次索引
+        self._watchers: Dict[str, List[str]] = {}
+        for subscriber_id, subscriber in self.subscribers.items():
+            for keyword in subscriber.get("watch", []):
+                self._watchers.setdefault(keyword, []).append(subscriber_id)
+
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.outbox_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    last_error TEXT,
+                    owner TEXT,
+                    claimed_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+                CREATE TABLE IF NOT EXISTS outbox_alerts (
+                    outbox_id INTEGER NOT NULL,
+                    recipient TEXT NOT NULL,
+                    store_key TEXT NOT NULL,
+                    item TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS outbox_alerts_batch ON outbox_alerts (outbox_id);
+                CREATE INDEX IF NOT EXISTS outbox_alerts_item ON outbox_alerts (recipient, store_key, item);
+                CREATE TABLE IF NOT EXISTS sent (
+                    recipient TEXT NOT NULL,
+                    store_key TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    last_sent REAL NOT NULL,
+                    PRIMARY KEY (recipient, store_key, item)
+                );
+            """)
+
+            # 舊版 outbox 沒有認領欄位
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+            for column, column_type in (("owner", "TEXT"), ("claimed_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {column_type}")
+        finally:
+            conn.close()
+
+    def match(self, results: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        比對搜尋結果與訂閱者關注的商品
+
+        Args:
+            results: search_all_stores 的回傳結果
+
+        Returns:
+            {收件者 id: 通知清單}
+        """
+        index = ItemIndex()
+        index.update_snapshot(results)
+
+        batches: Dict[str, Dict[Tuple[str, str, str], Dict[str, Any]]] = {}
+        for keyword, subscriber_ids in self._watchers.items():
+            matches = index.search(keyword)
+            if not matches:
+                continue
+
+            for subscriber_id in subscriber_ids:
+                subscriber = self.subscribers[subscriber_id]
+                within = subscriber.get("within")
+                min_qty = subscriber.get("min_qty", 1)
+
+                for match in matches:
+                    if match["qty"] < min_qty:
+                        continue
+                    if within is not None and (match["distance"] is None or match["distance"] > within):
+                        continue
+                    key = (match["brand"], str(match["store_no"]), match["name"])
+                    batches.setdefault(subscriber_id, {})[key] = match
+
+        return {
+            subscriber_id: list(alerts.values())
+            for subscriber_id, alerts in batches.items()
+        }
+
+    def enqueue(self, results: Dict[str, Any]) -> int:
+        """
+        將這次搜尋結果產生的通知寫入 outbox
+
+        Args:
+            results: search_all_stores 的回傳結果
+
+        Returns:
+            新增的批次數
+        """
+        batches = self.match(results)
+        if not batches:
+            return 0
+
+        now = time.time()
+        cutoff = now - self.cooldown_seconds
+        query_time = results.get("query_time", "")
+        queued = 0
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for recipient, alerts in batches.items():
+                fresh = []
+                for alert in alerts:
+                    store_key = f"{alert['brand']}:{alert['store_no']}"
+                    # 冷卻時間內已送達過的不再通知
+                    row = conn.execute(
+                        "SELECT last_sent FROM sent WHERE recipient = ? AND store_key = ? AND item = ?",
+                        (recipient, store_key, alert["name"])
+                    ).fetchone()
+                    if row and row[0] > cutoff:
+                        continue
+                    # 已在 outbox 中等待送出的也不重複排入
+                    row = conn.execute(
+                        "SELECT 1 FROM outbox_alerts a JOIN outbox o ON o.id = a.outbox_id "
+                        "WHERE a.recipient = ? AND a.store_key = ? AND a.item = ? "
+                        "AND o.status IN ('pending', 'sending') LIMIT 1",
+                        (recipient, store_key, alert["name"])
+                    ).fetchone()
+                    if row:
+                        continue
+                    fresh.append((store_key, alert))
+
+                if fresh:
+                    payload = json.dumps(
+                        {"recipient": recipient, "query_time": query_time, "alerts": [a for _, a in fresh]},
+                        ensure_ascii=False
+                    )
+                    outbox_id = conn.execute(
+                        "INSERT INTO outbox (recipient, payload, next_attempt) VALUES (?, ?, ?)",
+                        (recipient, payload, now)
+                    ).lastrowid
+                    conn.executemany(
+                        "INSERT INTO outbox_alerts (outbox_id, recipient, store_key, item) VALUES (?, ?, ?, ?)",
+                        [(outbox_id, recipient, store_key, alert["name"]) for store_key, alert in fresh]
+                    )
+                    queued += 1
+
+            # 順便清掉早已過了冷卻時間的紀錄
+            conn.execute("DELETE FROM sent WHERE last_sent <= ?", (cutoff,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if queued:
+            self._idle.clear()
+            self._wake.set()
+        return queued
+
+    def _send(self, recipient: str, payload: str):
+        """送出單一批次（在 executor 執行緒中執行）"""
+        subscriber = self.subscribers.get(recipient, {})
+        channel = subscriber.get("channel", WEBHOOK if subscriber.get("url") else CONSOLE)
+
+        if channel == WEBHOOK:
+            response = requests.post(
+                subscriber["url"],
+                data=payload.encode("utf-8"),
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                timeout=self.send_timeout
+            )
+            response.raise_for_status()
+        elif channel == CONSOLE:
+            data = json.loads(payload)
+            print(f"🔔 通知 {recipient}: {len(data['alerts'])} 項關注商品有貨")
+            for alert in data["alerts"]:
+                print(f"   【{alert['brand']}】{alert['store_name']} - {alert['name']}: {alert['qty']} 個")
+        else:
+            raise ValueError(f"不支援的通知管道: {channel}")
+
+    def _finish(
+        self,
+        conn: sqlite3.Connection,
+        row_id: int,
+        owner: str,
+        attempts: int,
+        error: Optional[Exception]
+    ):
+        """
+        在單一交易內記錄一個批次的送出結果
+
+        Args:
+            conn: outbox 連線
+            row_id: 批次 id
+            owner: 認領者
+            attempts: 含這次在內的嘗試次數
+            error: 送出失敗的例外，None 表示已送達
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if error is None:
+                # 送達後才記錄冷卻時間
+                conn.execute(
+                    "UPDATE outbox SET status = 'sent', attempts = ?, owner = NULL WHERE id = ?",
+                    (attempts, row_id)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sent (recipient, store_key, item, last_sent) "
+                    "SELECT recipient, store_key, item, ? FROM outbox_alerts WHERE outbox_id = ?",
+                    (time.time(), row_id)
+                )
+                conn.execute("DELETE FROM outbox_alerts WHERE outbox_id = ?", (row_id,))
+            elif attempts > self.max_retries:
+                conn.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ?, owner = NULL "
+                    "WHERE id = ? AND owner = ?",
+                    (attempts, str(error), row_id, owner)
+                )
+                conn.execute("DELETE FROM outbox_alerts WHERE outbox_id = ?", (row_id,))
+            else:
+                next_attempt = time.time() + self.RETRY_BASE * 2 ** (attempts - 1)
+                conn.execute(
+                    "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ?, "
+                    "owner = NULL WHERE id = ? AND owner = ?",
+                    (attempts, next_attempt, str(error), row_id, owner)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _worker(
+        self,
+        queue: "asyncio.Queue[Tuple[int, str, str, int]]",
+        conn: sqlite3.Connection,
+        owner: str
+    ):
+        loop = asyncio.get_running_loop()
+        while True:
+            row_id, recipient, payload, attempts = await queue.get()
+            try:
+                error = None
+                try:
+                    await loop.run_in_executor(None, self._send, recipient, payload)
+                except Exception as e:
+                    error = e
+
+                try:
+                    self._finish(conn, row_id, owner, attempts + 1, error)
+                except sqlite3.Error as e:
+                    # 資料庫暫時無法寫入（例如鎖定逾時）時 worker 繼續執行；
+                    # 批次維持 sending，認領逾時後會重新排入
+                    print(f"⚠️  通知批次 {row_id} 狀態寫入失敗: {e}")
+            finally:
+                queue.task_done()
+
+    def _claim(self, conn: sqlite3.Connection, owner: str) -> List[Tuple[int, str, str, int]]:
+        """
+        在單一交易內認領可送出的批次
+
+        多個行程共用同一個 outbox 時，每個批次只會被一個行程認領；
+        認領逾時的批次 (行程異常結束) 會先放回 pending
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'pending', owner = NULL "
+                "WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)",
+                (now - self.send_timeout - self.LEASE_GRACE,)
+            )
+            conn.execute(
+                "UPDATE outbox SET status = 'sending', owner = ?, claimed_at = ? WHERE id IN ("
+                "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt <= ? ORDER BY id LIMIT ?)",
+                (owner, now, now, self.workers)
+            )
+            rows = conn.execute(
+                "SELECT id, recipient, payload, attempts FROM outbox "
+                "WHERE status = 'sending' AND owner = ? AND claimed_at = ? ORDER BY id",
+                (owner, now)
+            ).fetchall()
+            conn.execute("COMMIT")
+            return rows
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _run(self):
+        conn = self._connect()
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue, conn, owner)) for _ in range(self.workers)]
+        loop = asyncio.get_running_loop()
+
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                # 每輪最多認領 workers 筆，同一輪內全部同時送出，認領期限只需涵蓋單次送出
+                try:
+                    rows = self._claim(conn, owner)
+                except sqlite3.Error as e:
+                    print(f"⚠️  讀取通知 outbox 失敗，稍後重試: {e}")
+                    await loop.run_in_executor(None, self._wake.wait, self.RETRY_BASE)
+                    continue
+
+                for row in rows:
+                    await queue.put(row)
+                await queue.join()
+
+                if rows:
+                    continue
+
+                # 取出之後若沒有新的 enqueue，代表目前沒有可送出的批次
+                if not self._wake.is_set():
+                    self._idle.set()
+
+                # 下一次重試，或其他行程的認領逾時
+                try:
+                    next_row = conn.execute(
+                        "SELECT MIN(CASE WHEN status = 'pending' THEN next_attempt "
+                        "ELSE COALESCE(claimed_at, 0) + ? END) FROM outbox "
+                        "WHERE status IN ('pending', 'sending')",
+                        (self.send_timeout + self.LEASE_GRACE,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"⚠️  讀取通知 outbox 失敗，稍後重試: {e}")
+                    next_row = (time.time() + self.RETRY_BASE,)
+                wait = None if next_row[0] is None else max(0.0, next_row[0] - time.time())
+                await loop.run_in_executor(None, self._wake.wait, wait)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            conn.close()
+
+    def start(self):
+        """啟動背景派送執行緒"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._idle.clear()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+        self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待目前可送出的通知都處理完畢
+
+        Args:
+            timeout: 最多等待秒數，None 表示不限制
+
+        Returns:
+            是否在時間內處理完畢（仍在等待重試的批次不算）
+        """
+        self._wake.set()
+        return self._idle.wait(timeout)
+
+    def stop(self):
+        """停止背景派送執行緒，未送出的通知保留在 outbox"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def pending_count(self) -> int:
+        """outbox 中尚未送出的批次數"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+def build_dispatcher(notify_config: Optional[Dict[str, Any]], base_dir: str = "") -> Optional[AlertDispatcher]:
+    """
+    依 config.json["notify"] 建立通知派送器
+
+    訂閱者可直接寫在 subscribers，也可放在 subscribers_file 指定的 JSON 檔
+
+    Args:
+        notify_config: 通知設定，None 或 enabled 為 false 時不通知
+        base_dir: 相對路徑的 outbox_file / subscribers_file 以此目錄為準
+
+    Returns:
+        AlertDispatcher 或 None
+    """
+    if not notify_config or not notify_config.get("enabled", False):
+        return None
+
+    subscribers = list(notify_config.get("subscribers", []))
+    subscribers_file = notify_config.get("subscribers_file")
+    if subscribers_file:
+        subscribers_file = os.path.join(base_dir, subscribers_file)
+    if subscribers_file and os.path.exists(subscribers_file):
+        with open(subscribers_file, "r", encoding="utf-8") as f:
+            subscribers.extend(json.load(f))
+
+    return AlertDispatcher(
+        subscribers,
+        outbox_path=os.path.join(base_dir, notify_config.get("outbox_file", ".notify_outbox.sqlite3")),
+        cooldown_seconds=notify_config.get("cooldown_minutes", 60) * 60,
+        workers=notify_config.get("workers", 8),
+        max_retries=notify_config.get("max_retries", 3),
+        send_timeout=notify_config.get("timeout_seconds", 10),
+    )
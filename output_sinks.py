@@ -0,0 +1,305 @@
+"""
+搜尋結果輸出模組
+依 config.json["output"] 設定建立輸出目標 (sink)，所有檔案皆以
+「暫存檔 + rename」方式寫入，讀取端不會讀到寫到一半的檔案
+"""
+import gzip
+import json
+import os
+import stat
+import tempfile
+from datetime import datetime
+from typing import List, Dict, Any, Callable, BinaryIO
+
+from columnar_snapshot import encode_snapshot
+
+
+def _read_umask() -> int:
+    """取得目前的 umask（os.umask 只能以設定的方式讀取）"""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+# 只在載入模組時讀取一次：之後暫時改動 umask 會影響其他執行緒建立的檔案
+# （例如限時搜尋的背景執行緒仍在開啟 SQLite WAL 檔）
+_UMASK = _read_umask()
+
+
+def atomic_write(path: str, write_func: Callable[[BinaryIO], None], exclusive: bool = False):
+    """
+    以原子方式寫入檔案
+
+    先寫到同目錄下的暫存檔，fsync 後再 rename 覆蓋目標檔案。
+    mkstemp 建立的暫存檔權限為 0600，rename 前改成既有檔案的權限，
+    新檔案則與 open() 相同依 umask 決定（通常為 0644）
+
+    Args:
+        path: 目標檔案路徑
+        write_func: 接收二進位檔案物件並寫入內容的函數
+        exclusive: 目標檔案已存在時不覆蓋，改為拋出 FileExistsError
+            （以 os.link 建立，同名檔案只會有一個寫入者成功）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~_UMASK
+            os.fchmod(f.fileno(), mode)
+            write_func(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if exclusive:
+            os.link(tmp_path, path)
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def render_text_report(results: Dict[str, Any]) -> str:
+    """
+    產生文字報告內容
+
+    Args:
+        results: 搜尋結果
+
+    Returns:
+        報告文字
+    """
+    lines = [
+        "=" * 80,
+        "便利商店即期品搜尋報告",
+        "=" * 80,
+        "",
+    ]
+
+    location = results["location"]
+    lines.append(f"位置: {location.get('description', '')} ({location['latitude']}, {location['longitude']})")
+    lines.append(f"搜尋範圍: {results['search_settings']['max_distance_meters']} 公尺內")
+    lines.append(f"查詢時間: {results['query_time']}")
+    lines.append("")
+    lines.append("-" * 80)
+
+    for i, store in enumerate(results["all_stores"], 1):
+        brand = store.get("brand", "")
+        name = store.get("store_name", "")
+        distance = store.get("distance", 0)
+        total_qty = store.get("total_qty", 0)
+        address = store.get("address", "")
+
+        lines.append("")
+        lines.append(f"{i}. 【{brand}】{name}")
+        lines.append(f"   距離: {distance:.0f} 公尺 | 即期品: {total_qty} 項")
+        if address:
+            lines.append(f"   地址: {address}")
+
+        items = store.get("items", [])
+        if items:
+            lines.append("   商品:")
+            for item in items:
+                lines.append(f"     - {item['name']}: {item['qty']} 個")
+
+        lines.append("")
+
+    return "\n".join(lines) + "\n"
+
+
+class OutputSink:
+    """輸出目標基底類別"""
+
+    label = "輸出"
+
+    def __init__(self, path: str):
+        """
+        初始化輸出目標
+
+        Args:
+            path: 輸出檔案路徑
+        """
+        self.path = path
+
+    def encode(self, results: Dict[str, Any]) -> bytes:
+        """將搜尋結果編碼成位元組"""
+        raise NotImplementedError
+
+    def write(self, results: Dict[str, Any]):
+        """寫入搜尋結果"""
+        data = self.encode(results)
+        atomic_write(self.path, lambda f: f.write(data))
+
+
+class JsonSink(OutputSink):
+    """JSON 輸出，預設為不縮排的精簡格式"""
+
+    label = "JSON 結果"
+
+    def __init__(self, path: str, indent: Any = None):
+        """
+        初始化 JSON 輸出
+
+        Args:
+            path: 輸出檔案路徑
+            indent: 縮排空格數，None 表示精簡格式
+        """
+        super().__init__(path)
+        self.indent = indent
+
+    def encode(self, results: Dict[str, Any]) -> bytes:
+        if self.indent is None:
+            text = json.dumps(results, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = json.dumps(results, ensure_ascii=False, indent=self.indent)
+        return text.encode("utf-8")
+
+
+class TextReportSink(OutputSink):
+    """文字報告輸出"""
+
+    label = "文字報告"
+
+    def encode(self, results: Dict[str, Any]) -> bytes:
+        return render_text_report(results).encode("utf-8")
+
+
+class NdjsonGzipSink(OutputSink):
+    """
+    gzip 壓縮的 NDJSON 輸出
+
+    每個門市一行，行內附上 query_time。append 模式下 path 為目錄，
+    每次執行寫成一個獨立的分段檔 {path}/YYYYmmddTHHMMSS_ffffff_{pid}.ndjson.gz，
+    讀取端以 glob 取得完整時間序列；每次寫入量只與本次結果有關
+    """
+
+    label = "NDJSON.gz 結果"
+
+    def __init__(self, path: str, append: bool = False, compresslevel: int = 6):
+        """
+        初始化 NDJSON.gz 輸出
+
+        Args:
+            path: 輸出檔案路徑（append 模式為分段檔目錄）
+            append: 是否以分段檔保存每次的結果
+            compresslevel: gzip 壓縮等級
+        """
+        super().__init__(path)
+        self.append = append
+        self.compresslevel = compresslevel
+
+    def encode(self, results: Dict[str, Any]) -> bytes:
+        query_time = results.get("query_time", "")
+        lines = []
+        for store in results.get("all_stores", []):
+            record = dict(store)
+            record["query_time"] = query_time
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        text = "\n".join(lines) + "\n" if lines else ""
+        return gzip.compress(text.encode("utf-8"), compresslevel=self.compresslevel, mtime=0)
+
+    def segment_stem(self, results: Dict[str, Any]) -> str:
+        """
+        取得這次結果的分段檔名稱（不含序號與副檔名）
+
+        名稱包含微秒與行程編號，同時執行的排程不會選到同一個名稱
+
+        Args:
+            results: 搜尋結果
+
+        Returns:
+            例如 20250101T120000_123456_4242
+        """
+        try:
+            timestamp = datetime.fromisoformat(results.get("query_time", ""))
+        except ValueError:
+            timestamp = datetime.now()
+
+        return f"{timestamp.strftime('%Y%m%dT%H%M%S_%f')}_{os.getpid()}"
+
+    def write(self, results: Dict[str, Any]):
+        data = self.encode(results)
+
+        if not self.append:
+            atomic_write(self.path, lambda f: f.write(data))
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        stem = self.segment_stem(results)
+        path = os.path.join(self.path, f"{stem}.ndjson.gz")
+        sequence = 1
+        while True:
+            # 以 exclusive 寫入認領檔名，已被使用時換下一個序號，不會覆蓋其他分段
+            try:
+                atomic_write(path, lambda f: f.write(data), exclusive=True)
+                return
+            except FileExistsError:
+                path = os.path.join(self.path, f"{stem}_{sequence}.ndjson.gz")
+                sequence += 1
+
+
+class ColumnarSink(OutputSink):
+    """欄位式快照輸出，格式見 columnar_snapshot 模組"""
+
+    label = "欄位式快照"
+
+    def encode(self, results: Dict[str, Any]) -> bytes:
+        return encode_snapshot(results)
+
+
+SINK_TYPES = {
+    "json": JsonSink,
+    "txt": TextReportSink,
+    "ndjson_gz": NdjsonGzipSink,
+    "columnar": ColumnarSink,
+}
+
+
+def build_sinks(output_config: Dict[str, Any]) -> List[OutputSink]:
+    """
+    依設定建立輸出目標
+
+    支援 "sinks" 清單，例如:
+        {"type": "ndjson_gz", "file": "history", "append": true}
+    未設定 "sinks" 時沿用 save_json / json_file / save_txt / txt_file 舊設定
+
+    Args:
+        output_config: config.json 中的 output 區塊
+
+    Returns:
+        輸出目標清單
+    """
+    sink_configs = output_config.get("sinks")
+
+    if sink_configs is None:
+        sink_configs = []
+        if output_config.get("save_json", True):
+            sink_configs.append({
+                "type": "json",
+                "file": output_config.get("json_file", "expired_food_results.json"),
+                "indent": output_config.get("json_indent"),
+            })
+        if output_config.get("save_txt", True):
+            sink_configs.append({
+                "type": "txt",
+                "file": output_config.get("txt_file", "expired_food_report.txt"),
+            })
+
+    sinks = []
+    for sink_config in sink_configs:
+        sink_type = sink_config.get("type", "")
+        if sink_type not in SINK_TYPES:
+            raise ValueError(f"不支援的輸出類型: {sink_type}")
+
+        options = {k: v for k, v in sink_config.items() if k not in ("type", "file")}
+        sinks.append(SINK_TYPES[sink_type](sink_config["file"], **options))
+
+    return sinks
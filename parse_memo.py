@@ -0,0 +1,101 @@
+"""
+門市資料解析快取模組
+以 (品牌, 店號) 記住上次的原始資料與整理好的門市資訊，
+輪詢時原始資料完全相同就直接回傳上次的結果，不需重新建立 categories / items
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+
+class ParseMemo:
+    """
+    有容量上限的 LRU 解析快取
+
+    每間門市只保留最新一份原始資料的結果，資料變動時直接取代舊的紀錄。
+    回傳的門市資訊會被之後的查詢共用，呼叫端不可修改
+
+    原始資料以 == 與上次保留的資料比較，而不是重新序列化後計算雜湊：
+    比較在 C 層逐欄進行、不配置新物件，成本遠低於序列化或重新解析
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        初始化解析快取
+
+        Args:
+            maxsize: 最多保留幾間門市
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(
+        self,
+        brand: str,
+        store_no: str,
+        payload: Any,
+        build: Callable[[], Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        取得門市資訊，原始資料與上次相同時直接回傳上次的結果
+
+        Args:
+            brand: 品牌
+            store_no: 店號
+            payload: 整理門市資訊所用到的全部原始資料（之後不可再修改）
+            build: 原始資料變動時呼叫，回傳整理好的門市資訊
+
+        Returns:
+            門市資訊
+        """
+        key = (brand, str(store_no))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == payload:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        record = build()
+
+        with self._lock:
+            self._entries[key] = (payload, record)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return record
+
+    def clear(self):
+        """清除所有紀錄"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        取得命中統計
+
+        Returns:
+            {"size", "maxsize", "hits", "misses", "evictions", "hit_rate"}
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# 同一行程內兩家品牌共用的解析快取
+store_memo = ParseMemo()
@@ -0,0 +1,350 @@
+"""
+跨行程共用的 API 請求速率限制模組
+以 SQLite 檔案保存每個上游主機 / 端點的 token bucket，
+同時執行的多個 cron / 批次程式會共用同一組額度
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class RateLimiter:
+    """
+    SQLite 式 token bucket 排程器
+
+    每次請求會同時消耗「主機」與「端點」(若有設定) 兩個 bucket。
+    互動查詢 (interactive) 等待時會登記在 waiters 表，背景請求 (background)
+    在有互動查詢等待、或 bucket 剩餘量低於保留額度時會讓出。
+    """
+
+    # 等待登記的有效秒數，行程異常結束時登記會自動失效
+    WAITER_TTL = 5.0
+
+    # 單次 sleep 上限，避免錯過其他行程釋放的額度
+    MAX_SLEEP = 0.5
+
+    def __init__(
+        self,
+        db_path: str = ".rate_limit.sqlite3",
+        default_rate: float = 2.0,
+        default_burst: float = 5.0,
+        hosts: Optional[Dict[str, Dict[str, Any]]] = None,
+        background_reserve: float = 1.0
+    ):
+        """
+        初始化速率限制器
+
+        Args:
+            db_path: 共用的 SQLite 檔案路徑
+            default_rate: 預設每秒補充的 token 數
+            default_burst: 預設 bucket 容量
+            hosts: 各主機設定，格式為
+                {host: {"rate": ..., "burst": ..., "endpoints": {path: {"rate": ..., "burst": ...}}}}
+            background_reserve: 背景請求必須保留給互動查詢的 token 數
+        """
+        self.db_path = db_path
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.hosts = hosts or {}
+        self.background_reserve = background_reserve
+        self.metrics: Dict[Tuple[str, str], Dict[str, float]] = {}
+        # 同一行程內多個執行緒共用 metrics 與 waiters 登記（waiters 依行程登記，以計數管理）
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, int] = {}
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS waiters (
+                    key TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    until REAL NOT NULL,
+                    PRIMARY KEY (key, pid)
+                );
+                CREATE TABLE IF NOT EXISTS stats (
+                    key TEXT NOT NULL,
+                    priority TEXT NOT NULL,
+                    requests INTEGER NOT NULL,
+                    total_delay REAL NOT NULL,
+                    max_delay REAL NOT NULL,
+                    PRIMARY KEY (key, priority)
+                );
+            """)
+        finally:
+            conn.close()
+
+    def buckets_for(self, url: str) -> List[Tuple[str, float, float]]:
+        """
+        取得一個網址需要消耗的 bucket 清單
+
+        Args:
+            url: 請求網址
+
+        Returns:
+            (bucket key, 每秒補充量, 容量) 清單
+        """
+        parsed = urlparse(url)
+        host = parsed.netloc
+        path = parsed.path
+
+        host_config = self.hosts.get(host, {})
+        buckets = [(
+            host,
+            float(host_config.get("rate", self.default_rate)),
+            float(host_config.get("burst", self.default_burst)),
+        )]
+
+        for endpoint, endpoint_config in host_config.get("endpoints", {}).items():
+            if path.endswith(endpoint):
+                buckets.append((
+                    f"{host}{path}",
+                    float(endpoint_config.get("rate", self.default_rate)),
+                    float(endpoint_config.get("burst", self.default_burst)),
+                ))
+                break
+
+        return buckets
+
+    def _try_acquire(
+        self,
+        conn: sqlite3.Connection,
+        buckets: List[Tuple[str, float, float]],
+        priority: str
+    ) -> float:
+        """
+        在單一交易內嘗試取得所有 bucket 的 token
+
+        Returns:
+            0 表示成功取得，否則為建議等待秒數
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            states = []
+            wait = 0.0
+
+            for key, rate, burst in buckets:
+                row = conn.execute(
+                    "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    tokens = min(burst, row[0] + (now - row[1]) * rate)
+                else:
+                    tokens = burst
+
+                needed = 1.0
+                if priority == BACKGROUND:
+                    # 保留額度不能超過 bucket 容量，否則背景請求永遠取不到
+                    needed = max(1.0, min(needed + self.background_reserve, burst))
+                    # 其他行程看 waiters 表，本行程的互動查詢看 self._waiting
+                    # （waiters 表依行程登記，無法分辨是否為本執行緒自己）
+                    with self._lock:
+                        waiting = self._waiting.get(key, 0)
+                    if not waiting:
+                        waiting = conn.execute(
+                            "SELECT COUNT(*) FROM waiters WHERE key = ? AND until > ? AND pid != ?",
+                            (key, now, os.getpid())
+                        ).fetchone()[0]
+                    if waiting:
+                        needed = max(needed, burst + 1.0)
+
+                if tokens < needed:
+                    deficit = min(needed, burst) - tokens
+                    wait = max(wait, deficit / rate if deficit > 0 else 1.0 / rate)
+
+                states.append((key, tokens))
+
+            if wait > 0:
+                conn.execute("COMMIT")
+                return wait
+
+            for key, tokens in states:
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens - 1.0, now)
+                )
+            conn.execute("COMMIT")
+            return 0.0
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _set_waiting(self, conn: sqlite3.Connection, keys: List[str], waiting: bool):
+        """
+        登記或取消本執行緒的等待
+
+        waiters 表依行程登記，同一行程內的執行緒以計數共用；
+        最後一個等待的執行緒離開時才刪除登記
+        """
+        with self._lock:
+            if waiting:
+                for key in keys:
+                    self._waiting[key] = self._waiting.get(key, 0) + 1
+                self._refresh_waiting(conn, keys)
+            else:
+                released = []
+                for key in keys:
+                    self._waiting[key] -= 1
+                    if self._waiting[key] == 0:
+                        del self._waiting[key]
+                        released.append(key)
+                conn.executemany(
+                    "DELETE FROM waiters WHERE key = ? AND pid = ?",
+                    [(key, os.getpid()) for key in released]
+                )
+
+    def _refresh_waiting(self, conn: sqlite3.Connection, keys: List[str]):
+        """延長等待登記的有效時間"""
+        until = time.time() + self.WAITER_TTL
+        conn.executemany(
+            "INSERT OR REPLACE INTO waiters (key, pid, until) VALUES (?, ?, ?)",
+            [(key, os.getpid(), until) for key in keys]
+        )
+
+    def _record(self, conn: sqlite3.Connection, key: str, priority: str, delay: float):
+        with self._lock:
+            metric = self.metrics.setdefault(
+                (key, priority), {"requests": 0, "total_delay": 0.0, "max_delay": 0.0}
+            )
+            metric["requests"] += 1
+            metric["total_delay"] += delay
+            metric["max_delay"] = max(metric["max_delay"], delay)
+
+        conn.execute("""
+            INSERT INTO stats (key, priority, requests, total_delay, max_delay)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (key, priority) DO UPDATE SET
+                requests = requests + 1,
+                total_delay = total_delay + excluded.total_delay,
+                max_delay = MAX(max_delay, excluded.max_delay)
+        """, (key, priority, delay, delay))
+
+    def acquire(self, url: str, priority: str = INTERACTIVE) -> float:
+        """
+        等待直到可以對指定網址發出請求
+
+        Args:
+            url: 請求網址
+            priority: INTERACTIVE 或 BACKGROUND
+
+        Returns:
+            排隊等待的秒數
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支援的優先權: {priority}")
+
+        buckets = self.buckets_for(url)
+        keys = [key for key, _, _ in buckets]
+        start = time.monotonic()
+
+        conn = self._connect()
+        try:
+            registered = False
+            try:
+                while True:
+                    wait = self._try_acquire(conn, buckets, priority)
+                    if wait == 0:
+                        break
+                    if priority == INTERACTIVE:
+                        if registered:
+                            with self._lock:
+                                self._refresh_waiting(conn, keys)
+                        else:
+                            self._set_waiting(conn, keys, True)
+                            registered = True
+                    time.sleep(min(wait, self.MAX_SLEEP))
+            finally:
+                if registered:
+                    self._set_waiting(conn, keys, False)
+
+            delay = time.monotonic() - start
+            self._record(conn, keys[0], priority, delay)
+            return delay
+        finally:
+            conn.close()
+
+    def get_metrics(self, shared: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        取得排隊延遲統計
+
+        Args:
+            shared: True 表示讀取所有行程的累計統計，否則只回傳本行程的統計
+
+        Returns:
+            {"主機/優先權": {"requests", "total_delay", "avg_delay", "max_delay"}}
+        """
+        if shared:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT key, priority, requests, total_delay, max_delay FROM stats"
+                ).fetchall()
+            finally:
+                conn.close()
+            source = {
+                (key, priority): {"requests": requests, "total_delay": total, "max_delay": max_delay}
+                for key, priority, requests, total, max_delay in rows
+            }
+        else:
+            with self._lock:
+                source = {key: dict(metric) for key, metric in self.metrics.items()}
+
+        report = {}
+        for (key, priority), metric in sorted(source.items()):
+            requests = metric["requests"]
+            report[f"{key}/{priority}"] = {
+                "requests": requests,
+                "total_delay": round(metric["total_delay"], 4),
+                "avg_delay": round(metric["total_delay"] / requests, 4) if requests else 0.0,
+                "max_delay": round(metric["max_delay"], 4),
+            }
+        return report
+
+
+def build_rate_limiter(rate_config: Optional[Dict[str, Any]], base_dir: str = "") -> Optional[RateLimiter]:
+    """
+    依 config.json["rate_limit"] 建立速率限制器
+
+    Args:
+        rate_config: 速率限制設定，None 或 enabled 為 false 時不限制
+        base_dir: 相對路徑的 db_file 以此目錄為準（通常為 config.json 所在目錄），
+            從不同工作目錄啟動的排程才會共用同一個 bucket 檔案
+
+    Returns:
+        RateLimiter 或 None
+    """
+    if not rate_config or not rate_config.get("enabled", True):
+        return None
+
+    default = rate_config.get("default", {})
+    return RateLimiter(
+        db_path=os.path.join(base_dir, rate_config.get("db_file", ".rate_limit.sqlite3")),
+        default_rate=default.get("rate", 2.0),
+        default_burst=default.get("burst", 5.0),
+        hosts=rate_config.get("hosts", {}),
+        background_reserve=rate_config.get("background_reserve", 1.0),
+    )
@@ -0,0 +1,141 @@
+"""
+API 回應快取模組
+保存門市商品明細與地址等回應，設定 db_file 時會寫入 SQLite，
+下次執行 (或同時執行的其他程式) 可以直接使用，不需重新查詢上游
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
+
+
+class ResponseCache:
+    """
+    兩層回應快取：行程內的 dict，加上可選的 SQLite 檔案
+
+    時間以 time.time() 記錄，跨行程與重新執行後仍可判斷是否過期
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age: float = 24 * 60 * 60):
+        """
+        初始化回應快取
+
+        Args:
+            path: SQLite 檔案路徑，None 表示只保存在記憶體
+            max_age: 超過這個秒數的紀錄在開啟時清除
+        """
+        self.path = path
+        self.max_age = max_age
+        self._memory: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+        if path:
+            self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    stored REAL NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (kind, key)
+                )
+            """)
+            conn.execute("DELETE FROM responses WHERE stored < ?", (time.time() - self.max_age,))
+        finally:
+            conn.close()
+
+    def get(self, kind: str, key: str, ttl: float) -> Optional[Any]:
+        """
+        取得未過期的回應
+
+        Args:
+            kind: 回應種類，例如 "detail"、"address"
+            key: 鍵值
+            ttl: 有效秒數
+
+        Returns:
+            回應內容，沒有或已過期時為 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get((kind, key))
+        if entry and now - entry[0] < ttl:
+            return entry[1]
+
+        if not self.path:
+            return None
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT stored, value FROM responses WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if not row or now - row[0] >= ttl:
+            return None
+
+        value = json.loads(row[1])
+        with self._lock:
+            self._memory[(kind, key)] = (row[0], value)
+        return value
+
+    def put(self, kind: str, key: str, value: Any):
+        """
+        保存回應
+
+        Args:
+            kind: 回應種類
+            key: 鍵值
+            value: 可轉成 JSON 的回應內容
+        """
+        now = time.time()
+        with self._lock:
+            self._memory[(kind, key)] = (now, value)
+
+        if not self.path:
+            return
+
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (kind, key, stored, value) VALUES (?, ?, ?, ?)",
+                (kind, key, now, json.dumps(value, ensure_ascii=False, separators=(",", ":")))
+            )
+        finally:
+            conn.close()
+
+
+def build_response_cache(cache_config: Optional[Dict[str, Any]], base_dir: str = "") -> Optional[ResponseCache]:
+    """
+    依 config.json["cache"] 建立回應快取
+
+    Args:
+        cache_config: 快取設定，None 或未明確設定 enabled 為 true 時不使用快取
+        base_dir: 相對路徑的 db_file 以此目錄為準（通常為 config.json 所在目錄）
+
+    Returns:
+        ResponseCache 或 None
+    """
+    if not cache_config or not cache_config.get("enabled", False):
+        return None
+
+    return ResponseCache(
+        path=os.path.join(base_dir, cache_config.get("db_file", ".api_cache.sqlite3")),
+        max_age=cache_config.get("max_age_hours", 24) * 60 * 60,
+    )
@@ -0,0 +1,214 @@
+"""
+取貨路線規劃模組
+從合併後的 all_stores 結果 (可依想要的商品過濾) 計算近似最短的巡店順序
+"""
+import math
+from typing import Optional, List, Dict, Any, Tuple
+
+from coverage_planner import LocalProjection
+
+
+def filter_stores_by_items(
+    stores: List[Dict[str, Any]],
+    wanted_items: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    只保留有想要商品的門市
+
+    Args:
+        stores: 門市清單
+        wanted_items: 商品名稱關鍵字，任一關鍵字出現在商品名稱中即算符合
+
+    Returns:
+        過濾後的門市清單
+    """
+    if not wanted_items:
+        return list(stores)
+
+    return [
+        store for store in stores
+        if any(
+            keyword in item.get("name", "")
+            for item in store.get("items", [])
+            for keyword in wanted_items
+        )
+    ]
+
+
+def distance_matrix(points: List[Tuple[float, float]]) -> List[List[float]]:
+    """
+    計算兩兩距離矩陣（公尺）
+
+    先一次把所有點投影成平面座標，再逐列計算，不重複呼叫三角函數
+
+    Args:
+        points: (lat, lon) 清單
+
+    Returns:
+        距離矩陣
+    """
+    if not points:
+        return []
+
+    lat0 = sum(p[0] for p in points) / len(points)
+    lon0 = sum(p[1] for p in points) / len(points)
+    projection = LocalProjection(lat0, lon0)
+    xy = [projection.to_xy(lat, lon) for lat, lon in points]
+    xs = [p[0] for p in xy]
+    ys = [p[1] for p in xy]
+
+    hypot = math.hypot
+    return [
+        [hypot(x - bx, y - by) for bx, by in zip(xs, ys)]
+        for x, y in zip(xs, ys)
+    ]
+
+
+def nearest_neighbor_tour(matrix: List[List[float]]) -> List[int]:
+    """從節點 0 出發的最近鄰路線"""
+    n = len(matrix)
+    tour = [0]
+    visited = [False] * n
+    visited[0] = True
+
+    current = 0
+    for _ in range(n - 1):
+        row = matrix[current]
+        best = -1
+        best_distance = float('inf')
+        for j in range(n):
+            if not visited[j] and row[j] < best_distance:
+                best = j
+                best_distance = row[j]
+        visited[best] = True
+        tour.append(best)
+        current = best
+
+    return tour
+
+
+def two_opt(
+    tour: List[int],
+    matrix: List[List[float]],
+    closed: bool = False,
+    max_passes: int = 50
+) -> List[int]:
+    """
+    以 2-opt 改善路線，起點 (tour[0]) 固定不動
+
+    Args:
+        tour: 初始路線
+        matrix: 距離矩陣
+        closed: 是否需要回到起點
+        max_passes: 最多掃描幾輪
+
+    Returns:
+        改善後的路線
+    """
+    tour = list(tour)
+    n = len(tour)
+    if n < 3:
+        return tour
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a = tour[i - 1]
+            b = tour[i]
+            row_a = matrix[a]
+            row_b = matrix[b]
+            d_ab = row_a[b]
+            for j in range(i + 1, n):
+                c = tour[j]
+                if j + 1 < n:
+                    d = tour[j + 1]
+                elif closed:
+                    d = tour[0]
+                else:
+                    d = -1
+
+                # 反轉 tour[i..j]：a-b ... c-d 變成 a-c ... b-d
+                if d >= 0:
+                    delta = row_a[c] + row_b[d] - d_ab - matrix[c][d]
+                else:
+                    delta = row_a[c] - d_ab
+
+                if delta < -1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+                    b = tour[i]
+                    row_b = matrix[b]
+                    d_ab = row_a[b]
+        if not improved:
+            break
+
+    return tour
+
+
+def plan_route(
+    stores: List[Dict[str, Any]],
+    start: Tuple[float, float],
+    wanted_items: Optional[List[str]] = None,
+    return_to_start: bool = False
+) -> Dict[str, Any]:
+    """
+    規劃巡店路線
+
+    距離為兩點間直線距離，作為步行距離的估計
+
+    Args:
+        stores: 門市清單（需有 latitude / longitude）
+        start: 出發位置 (lat, lon)
+        wanted_items: 想要的商品關鍵字，None 表示不過濾
+        return_to_start: 是否需要回到出發位置
+
+    Returns:
+        {"stops": 依序造訪的門市摘要, "total_distance": 總距離（公尺）, "skipped": 缺少座標的門市數}
+    """
+    candidates = filter_stores_by_items(stores, wanted_items or [])
+    located = [s for s in candidates if s.get("latitude") and s.get("longitude")]
+
+    points = [start] + [(s["latitude"], s["longitude"]) for s in located]
+    matrix = distance_matrix(points)
+    tour = two_opt(nearest_neighbor_tour(matrix), matrix, closed=return_to_start)
+
+    stops = []
+    total = 0.0
+    for prev, node in zip(tour, tour[1:]):
+        leg = matrix[prev][node]
+        total += leg
+        store = located[node - 1]
+        stops.append({
+            "brand": store.get("brand", ""),
+            "store_no": store.get("store_no", ""),
+            "store_name": store.get("store_name", ""),
+            "leg_distance": round(leg, 2),
+            "cumulative_distance": round(total, 2),
+        })
+
+    if return_to_start and len(tour) > 1:
+        total += matrix[tour[-1]][0]
+
+    return {
+        "stops": stops,
+        "total_distance": round(total, 2),
+        "return_to_start": return_to_start,
+        "skipped": len(candidates) - len(located),
+    }
+
+
+def print_route(route: Dict[str, Any]):
+    """印出巡店路線"""
+    stops = route["stops"]
+    if not stops:
+        print("\n🚶 沒有可規劃路線的門市")
+        return
+
+    print(f"\n🚶 建議巡店路線（共 {len(stops)} 間，總距離約 {route['total_distance']:.0f} 公尺）:\n")
+    for i, stop in enumerate(stops, 1):
+        print(f"{i}. 【{stop['brand']}】{stop['store_name']} (+{stop['leg_distance']:.0f} 公尺)")
+
+    if route["return_to_start"]:
+        print("   → 回到出發位置")
+    if route["skipped"]:
+        print(f"   ⚠️  {route['skipped']} 間門市缺少座標，未列入路線")
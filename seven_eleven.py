@@ -4,6 +4,10 @@
 import requests
 from typing import Optional, List, Dict, Any
 
+from rate_limiter import RateLimiter, INTERACTIVE
+from parse_memo import store_memo
+from response_cache import ResponseCache
+
 
 class SevenElevenAPI:
     """7-11 即期品 API"""
@@ -16,22 +20,44 @@ class SevenElevenAPI:
         "Referer": "https://lovefood.openpoint.com.tw/"
     }
     
-    def __init__(self, mid_v: str):
+    # 門市商品明細與地址的快取秒數
+    DETAIL_CACHE_TTL = 60
+    ADDRESS_CACHE_TTL = 24 * 60 * 60
+    
+    def __init__(
+        self,
+        mid_v: str,
+        rate_limiter: Optional[RateLimiter] = None,
+        priority: str = INTERACTIVE,
+        cache: Optional[ResponseCache] = None
+    ):
         """
         初始化 7-11 API
         
         Args:
             mid_v: API 認證用的 mid_v 參數
+            rate_limiter: 共用的速率限制器，None 表示不限制
+            priority: 請求優先權 (interactive / background)
+            cache: 明細與地址的回應快取，None 表示不使用快取（每次都查詢最新庫存）
         """
         self.mid_v = mid_v
         self.token: Optional[str] = None
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.cache = cache
+    
+    def _post(self, url: str, **kwargs) -> requests.Response:
+        """經過速率限制後發出 POST 請求"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire(url, self.priority)
+        return requests.post(url, headers=self.HEADERS, **kwargs)
     
     def get_access_token(self) -> str:
         """取得 Access Token"""
         url = self.BASE_URL + "Auth/FrontendAuth/AccessToken"
         params = {"mid_v": self.mid_v}
         
-        response = requests.post(url, params=params, json={}, headers=self.HEADERS)
+        response = self._post(url, params=params, json={})
         response.raise_for_status()
         
         result = response.json()
@@ -41,23 +67,28 @@ class SevenElevenAPI:
         else:
             raise Exception(f"取得 Token 失敗: {result}")
     
-    def get_nearby_stores(
-        self, 
-        latitude: float, 
+    def get_nearby_store_list(
+        self,
+        latitude: float,
         longitude: float,
-        max_distance: Optional[float] = None
+        search_latitude: Optional[float] = None,
+        search_longitude: Optional[float] = None
     ) -> List[Dict[str, Any]]:
         """
-        取得附近有即期品的門市
+        取得 GetNearbyStoreList 回傳的原始門市清單（未過濾）
         
         Args:
-            latitude: 緯度
-            longitude: 經度
-            max_distance: 最大距離（公尺），None 表示不限制
+            latitude: 目前位置緯度（Distance 以此計算）
+            longitude: 目前位置經度
+            search_latitude: 搜尋中心緯度，None 表示與目前位置相同
+            search_longitude: 搜尋中心經度
             
         Returns:
             門市清單
         """
+        if search_latitude is None or search_longitude is None:
+            search_latitude, search_longitude = latitude, longitude
+        
         if not self.token:
             self.get_access_token()
         
@@ -65,30 +96,49 @@ class SevenElevenAPI:
         params = {"token": self.token}
         body = {
             "CurrentLocation": {"Latitude": latitude, "Longitude": longitude},
-            "SearchLocation": {"Latitude": latitude, "Longitude": longitude}
+            "SearchLocation": {"Latitude": search_latitude, "Longitude": search_longitude}
         }
         
-        response = requests.post(url, params=params, json=body, headers=self.HEADERS)
+        response = self._post(url, params=params, json=body)
         response.raise_for_status()
         
         result = response.json()
         if result.get("isSuccess"):
-            stores = result.get("element", {}).get("StoreStockItemList", [])
-            
-            # 過濾有即期品的門市
-            stores_with_stock = [s for s in stores if s.get("RemainingQty", 0) > 0]
-            
-            # 過濾距離
-            if max_distance:
-                stores_with_stock = [
-                    s for s in stores_with_stock 
-                    if s.get("Distance", float('inf')) <= max_distance
-                ]
-            
-            return stores_with_stock
+            return result.get("element", {}).get("StoreStockItemList", [])
         else:
             raise Exception(f"查詢失敗: {result}")
     
+    def get_nearby_stores(
+        self, 
+        latitude: float, 
+        longitude: float,
+        max_distance: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        取得附近有即期品的門市
+        
+        Args:
+            latitude: 緯度
+            longitude: 經度
+            max_distance: 最大距離（公尺），None 表示不限制
+            
+        Returns:
+            門市清單
+        """
+        stores = self.get_nearby_store_list(latitude, longitude)
+        
+        # 過濾有即期品的門市
+        stores_with_stock = [s for s in stores if s.get("RemainingQty", 0) > 0]
+        
+        # 過濾距離
+        if max_distance:
+            stores_with_stock = [
+                s for s in stores_with_stock 
+                if s.get("Distance", float('inf')) <= max_distance
+            ]
+        
+        return stores_with_stock
+    
     def get_store_detail(
         self, 
         store_no: str, 
@@ -106,6 +156,11 @@ class SevenElevenAPI:
         Returns:
             門市詳細資訊
         """
+        if self.cache is not None:
+            cached = self.cache.get("detail", store_no, self.DETAIL_CACHE_TTL)
+            if cached is not None:
+                return cached
+        
         if not self.token:
             self.get_access_token()
         
@@ -116,12 +171,15 @@ class SevenElevenAPI:
             "CurrentLocation": {"Latitude": latitude, "Longitude": longitude}
         }
         
-        response = requests.post(url, params=params, json=body, headers=self.HEADERS)
+        response = self._post(url, params=params, json=body)
         response.raise_for_status()
         
         result = response.json()
         if result.get("isSuccess"):
-            return result.get("element", {})
+            element = result.get("element", {})
+            if self.cache is not None:
+                self.cache.put("detail", store_no, element)
+            return element
         else:
             raise Exception(f"查詢失敗: {result}")
     
@@ -135,27 +193,136 @@ class SevenElevenAPI:
         Returns:
             門市資訊
         """
+        if self.cache is not None:
+            cached = self.cache.get("address", store_name, self.ADDRESS_CACHE_TTL)
+            if cached is not None:
+                return cached
+        
         if not self.token:
             self.get_access_token()
         
         url = self.BASE_URL + "Master/FrontendStore/GetStoreByAddress"
         params = {"token": self.token, "keyword": store_name}
         
-        response = requests.post(url, params=params, json={}, headers=self.HEADERS)
+        response = self._post(url, params=params, json={})
         response.raise_for_status()
         
         result = response.json()
         if result.get("isSuccess"):
             stores = result.get("element", [])
-            # 找到完全匹配的店名
-            for store in stores:
-                if store.get("StoreName") == store_name:
-                    return store
-            # 如果沒有完全匹配，返回第一個
-            return stores[0] if stores else {}
+            # 找到完全匹配的店名，如果沒有完全匹配，返回第一個
+            match = next((s for s in stores if s.get("StoreName") == store_name), None)
+            if match is None:
+                match = stores[0] if stores else {}
+            if match and self.cache is not None:
+                self.cache.put("address", store_name, match)
+            return match
         else:
             return {}
     
+    def build_store_summary(self, store: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        只用 GetNearbyStoreList 的資料整理成統一格式（不含商品明細與地址）
+        
+        Args:
+            store: GetNearbyStoreList 回傳的單一門市
+            
+        Returns:
+            門市資訊
+        """
+        store_info = {
+            "brand": "7-11",
+            "store_no": store.get("StoreNo", ""),
+            "store_name": f"7-11 {store.get('StoreName', '')}門市",
+            "distance": round(store.get("Distance", 0), 2),
+            "latitude": store.get("Latitude"),
+            "longitude": store.get("Longitude"),
+            "total_qty": store.get("RemainingQty", 0),
+            "categories": [],
+            "items": []
+        }
+        
+        # 加入分類資訊
+        for cat in store.get("CategoryStockItems", []):
+            store_info["categories"].append({
+                "name": cat.get("Name", ""),
+                "qty": cat.get("RemainingQty", 0)
+            })
+        
+        return store_info
+    
+    @staticmethod
+    def apply_store_detail(store_info: Dict[str, Any], detail: Dict[str, Any]):
+        """將 GetStoreDetail 的商品明細填入門市資訊"""
+        store_stock_item = detail.get("StoreStockItem", {})
+        
+        # 取得商品詳情
+        category_stock_items = store_stock_item.get("CategoryStockItems", [])
+        
+        for cat in category_stock_items:
+            cat_name = cat.get("Name", "")
+            item_list = cat.get("ItemList", [])
+            
+            for item in item_list:
+                store_info["items"].append({
+                    "name": item.get("ItemName", ""),
+                    "qty": item.get("RemainingQty", 0),
+                    "category": cat_name
+                })
+    
+    @staticmethod
+    def apply_store_address(store_info: Dict[str, Any], store_detail: Dict[str, Any]):
+        """將 GetStoreByAddress 的地址與電話填入門市資訊"""
+        if store_detail:
+            store_info["address"] = store_detail.get("Address", "")
+            store_info["tel"] = store_detail.get("Telno", "")
+            if not store_info["latitude"]:
+                store_info["latitude"] = store_detail.get("Latitude")
+                store_info["longitude"] = store_detail.get("Longitude")
+    
+    def build_store_info(
+        self,
+        store: Dict[str, Any],
+        latitude: float,
+        longitude: float
+    ) -> Dict[str, Any]:
+        """
+        將 GetNearbyStoreList 的門市資料整理成統一格式，並補上商品明細與地址
+        
+        門市清單、明細與地址的原始資料都與上次相同時直接回傳上次整理好的結果（共用物件，不可修改）
+        
+        Args:
+            store: GetNearbyStoreList 回傳的單一門市
+            latitude: 緯度
+            longitude: 經度
+            
+        Returns:
+            門市資訊
+        """
+        store_no = store.get("StoreNo", "")
+        
+        # 取得詳細商品資訊
+        try:
+            detail = self.get_store_detail(store_no, latitude, longitude)
+        except Exception:
+            detail = None  # 無法取得詳情就跳過
+        
+        # 用店名查詢地址
+        try:
+            store_detail = self.get_store_by_name(store.get("StoreName", ""))
+        except Exception:
+            store_detail = None  # 無法取得地址就跳過
+        
+        def build() -> Dict[str, Any]:
+            store_info = self.build_store_summary(store)
+            if detail is not None:
+                self.apply_store_detail(store_info, detail)
+            if store_detail is not None:
+                self.apply_store_address(store_info, store_detail)
+            return store_info
+        
+        return store_memo.get_or_build("7-11", store_no, (store, detail, store_detail), build)
+    
     def search_expired_food(
         self,
         latitude: float,
@@ -183,61 +350,7 @@ class SevenElevenAPI:
         
         results = []
         for store in stores[:max_stores]:
-            store_no = store.get("StoreNo", "")
-            store_name = store.get("StoreName", "")
-            distance = store.get("Distance", 0)
-            remaining_qty = store.get("RemainingQty", 0)
-            category_items = store.get("CategoryStockItems", [])
-            
-            store_info = {
-                "brand": "7-11",
-                "store_no": store_no,
-                "store_name": f"7-11 {store_name}門市",
-                "distance": round(distance, 2),
-                "total_qty": remaining_qty,
-                "categories": [],
-                "items": []
-            }
-            
-            # 加入分類資訊
-            for cat in category_items:
-                store_info["categories"].append({
-                    "name": cat.get("Name", ""),
-                    "qty": cat.get("RemainingQty", 0)
-                })
-            
-            # 取得詳細商品資訊
-            try:
-                detail = self.get_store_detail(store_no, latitude, longitude)
-                store_stock_item = detail.get("StoreStockItem", {})
-                
-                # 取得商品詳情
-                category_stock_items = store_stock_item.get("CategoryStockItems", [])
-                
-                for cat in category_stock_items:
-                    cat_name = cat.get("Name", "")
-                    item_list = cat.get("ItemList", [])
-                    
-                    for item in item_list:
-                        store_info["items"].append({
-                            "name": item.get("ItemName", ""),
-                            "qty": item.get("RemainingQty", 0),
-                            "category": cat_name
-                        })
-                        
-            except Exception as e:
-                pass  # 無法取得詳情就跳過
-            
-            # 用店名查詢地址
-            try:
-                store_detail = self.get_store_by_name(store_name)
-                if store_detail:
-                    store_info["address"] = store_detail.get("Address", "")
-                    store_info["tel"] = store_detail.get("Telno", "")
-            except Exception:
-                pass  # 無法取得地址就跳過
-            
-            results.append(store_info)
+            results.append(self.build_store_info(store, latitude, longitude))
         
         return results
 
@@ -247,7 +360,10 @@ def search_seven_eleven(
     longitude: float,
     max_distance: float = 1000,
     max_stores: int = 10,
-    mid_v: str = ""
+    mid_v: str = "",
+    rate_limiter: Optional[RateLimiter] = None,
+    priority: str = INTERACTIVE,
+    cache: Optional[ResponseCache] = None
 ) -> List[Dict[str, Any]]:
     """
     搜尋 7-11 即期品的便利函數
@@ -258,9 +374,12 @@ def search_seven_eleven(
         max_distance: 最大距離（公尺）
         max_stores: 最多回傳幾間店
         mid_v: API 認證參數
+        rate_limiter: 共用的速率限制器
+        priority: 請求優先權
+        cache: 明細與地址的回應快取
         
     Returns:
         包含門市和商品資訊的清單
     """
-    api = SevenElevenAPI(mid_v)
+    api = SevenElevenAPI(mid_v, rate_limiter, priority, cache)
     return api.search_expired_food(latitude, longitude, max_distance, max_stores)
@@ -0,0 +1,344 @@
+"""
+地圖圖磚匯出模組
+將搜尋結果依標準 z/x/y 圖磚切成預先產生的 GeoJSON 靜態檔，
+每個圖磚附上摘要 (門市數、即期品總數、前幾名分類)，
+只重新寫入內容有變動的圖磚；這次搜尋範圍外的門市沿用上次匯出的資料
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+from collections import Counter
+from typing import Optional, List, Dict, Any, Tuple
+
+from columnar_snapshot import MAGIC, SnapshotReader
+from family_mart import FamilyMartAPI
+from item_index import ItemIndex
+from output_sinks import atomic_write
+
+
+DEFAULT_ZOOMS = [12, 14, 16]
+TOP_CATEGORIES = 5
+MANIFEST_FILE = "index.json"
+
+TileKey = Tuple[int, int, int]
+
+
+def lat_lon_to_tile(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """
+    經緯度轉成 Web Mercator 圖磚座標
+
+    Args:
+        latitude: 緯度
+        longitude: 經度
+        zoom: 縮放等級
+
+    Returns:
+        (x, y)
+    """
+    n = 2 ** zoom
+    lat_rad = math.radians(latitude)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return (min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+def store_feature(store: Dict[str, Any]) -> Dict[str, Any]:
+    """將門市轉成 GeoJSON Point feature"""
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [round(store["longitude"], 6), round(store["latitude"], 6)],
+        },
+        "properties": {
+            "brand": store.get("brand", ""),
+            "store_no": store.get("store_no", ""),
+            "store_name": store.get("store_name", ""),
+            "address": store.get("address", ""),
+            "total_qty": store.get("total_qty", 0),
+            "categories": store.get("categories", []),
+            "items": [
+                {"name": item.get("name", ""), "qty": item.get("qty", 0)}
+                for item in store.get("items", [])
+            ],
+        },
+    }
+
+
+def feature_key(feature: Dict[str, Any]) -> str:
+    """門市 feature 的識別鍵 (品牌/店號)"""
+    properties = feature["properties"]
+    return f"{properties['brand']}/{properties['store_no']}"
+
+
+def feature_in_area(
+    feature: Dict[str, Any],
+    location: Dict[str, float],
+    radii: Dict[str, float]
+) -> bool:
+    """
+    門市是否位於搜尋確定涵蓋的範圍內
+
+    Args:
+        feature: 門市 feature
+        location: 搜尋中心 {"latitude", "longitude"}
+        radii: 各品牌確定涵蓋的半徑（見 ItemIndex.snapshot_radii）
+
+    Returns:
+        是否在範圍內
+    """
+    radius = radii.get(feature["properties"]["brand"])
+    if radius is None:
+        return False
+    longitude, latitude = feature["geometry"]["coordinates"]
+    distance = FamilyMartAPI.calculate_distance(
+        location["latitude"], location["longitude"], latitude, longitude
+    )
+    return distance <= radius
+
+
+def tile_summary(features: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """計算圖磚摘要"""
+    categories: Counter = Counter()
+    total_qty = 0
+    for feature in features:
+        properties = feature["properties"]
+        total_qty += properties["total_qty"]
+        for category in properties["categories"]:
+            categories[category["name"]] += category["qty"]
+
+    return {
+        "store_count": len(features),
+        "total_qty": total_qty,
+        "top_categories": [
+            {"name": name, "qty": qty}
+            for name, qty in categories.most_common(TOP_CATEGORIES)
+        ],
+    }
+
+
+def tile_features(
+    features: List[Dict[str, Any]],
+    zooms: List[int]
+) -> Dict[TileKey, List[Dict[str, Any]]]:
+    """
+    將門市 feature 分配到各縮放等級的圖磚
+
+    Args:
+        features: 門市 feature
+        zooms: 縮放等級
+
+    Returns:
+        {(z, x, y): features}
+    """
+    tiles: Dict[TileKey, List[Dict[str, Any]]] = {}
+    for feature in features:
+        longitude, latitude = feature["geometry"]["coordinates"]
+        for zoom in zooms:
+            x, y = lat_lon_to_tile(latitude, longitude, zoom)
+            tiles.setdefault((zoom, x, y), []).append(feature)
+
+    for features in tiles.values():
+        features.sort(key=lambda f: (f["properties"]["brand"], str(f["properties"]["store_no"])))
+    return tiles
+
+
+def build_tiles(
+    stores: List[Dict[str, Any]],
+    zooms: List[int]
+) -> Dict[TileKey, List[Dict[str, Any]]]:
+    """
+    將門市分配到各縮放等級的圖磚
+
+    Args:
+        stores: 門市清單（缺少座標的門市會略過）
+        zooms: 縮放等級
+
+    Returns:
+        {(z, x, y): features}
+    """
+    return tile_features(
+        [store_feature(s) for s in stores if s.get("latitude") and s.get("longitude")],
+        zooms
+    )
+
+
+def stores_from_snapshot(path: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    從欄位式快照還原門市清單
+
+    Args:
+        path: 快照檔案路徑
+
+    Returns:
+        (門市清單, query_time)
+    """
+    with SnapshotReader(path) as reader:
+        stores = []
+        for i in range(reader.n_stores):
+            latitude = reader.column("latitude")[i]
+            longitude = reader.column("longitude")[i]
+            stores.append({
+                "brand": reader.string(reader.column("brand")[i]),
+                "store_no": reader.string(reader.column("store_no")[i]),
+                "store_name": reader.string(reader.column("store_name")[i]),
+                # 快照以 NaN 表示沒有座標
+                "latitude": latitude if latitude == latitude else None,
+                "longitude": longitude if longitude == longitude else None,
+                "total_qty": reader.column("total_qty")[i],
+                "categories": [],
+                "items": [],
+            })
+
+        for store_index, name, category, qty in zip(
+            reader.column("item_store"),
+            reader.column("item_name"),
+            reader.column("item_category"),
+            reader.column("item_qty")
+        ):
+            stores[store_index]["items"].append(
+                {"name": reader.string(name), "qty": qty, "category": reader.string(category)}
+            )
+
+        # 分類與 JSON 結果相同，使用上游回傳的分類摘要，而不是由商品明細加總
+        for store_index, name, qty in zip(
+            reader.column("category_store"),
+            reader.column("category_name"),
+            reader.column("category_qty")
+        ):
+            stores[store_index]["categories"].append({"name": reader.string(name), "qty": qty})
+
+        return stores, reader.query_time
+
+
+def export_tiles(
+    stores: List[Dict[str, Any]],
+    output_dir: str,
+    zooms: List[int] = DEFAULT_ZOOMS,
+    generated_at: str = "",
+    location: Optional[Dict[str, float]] = None,
+    radii: Optional[Dict[str, float]] = None
+) -> Dict[str, int]:
+    """
+    匯出 GeoJSON 圖磚
+
+    以 index.json 記錄每個圖磚的內容雜湊與摘要，以及所有門市的 feature，內容未變的圖磚不重寫。
+    上次匯出的門市只有位於這次搜尋確定涵蓋範圍內、且沒有出現在 stores 中時才移除（已賣完），
+    範圍外的門市沿用上次的資料；不再有門市的圖磚會在 index.json 更新後刪除
+
+    Args:
+        stores: 門市清單（缺少座標的門市會略過）
+        output_dir: 輸出目錄，圖磚路徑為 {z}/{x}/{y}.geojson
+        zooms: 縮放等級
+        generated_at: 資料時間，寫入 index.json
+        location: 搜尋中心 {"latitude", "longitude"}
+        radii: 各品牌確定涵蓋的半徑（見 ItemIndex.snapshot_radii），
+            與 location 任一為 None 時不移除上次匯出的門市
+
+    Returns:
+        {"written": 重寫的圖磚數, "unchanged": 未變動數, "removed": 刪除數}
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest_data: Dict[str, Any] = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest_data = json.load(f)
+    previous: Dict[str, Any] = manifest_data.get("tiles", {})
+
+    store_features: Dict[str, Dict[str, Any]] = {}
+    for key, feature in manifest_data.get("stores", {}).items():
+        if location and radii and feature_in_area(feature, location, radii):
+            continue
+        store_features[key] = feature
+    for store in stores:
+        if store.get("latitude") and store.get("longitude"):
+            feature = store_feature(store)
+            store_features[feature_key(feature)] = feature
+
+    tiles = tile_features(list(store_features.values()), zooms)
+    manifest_tiles = {}
+    stats = {"written": 0, "unchanged": 0, "removed": 0}
+
+    for (zoom, x, y), features in tiles.items():
+        key = f"{zoom}/{x}/{y}"
+        summary = tile_summary(features)
+        content = json.dumps(
+            {"type": "FeatureCollection", "summary": summary, "features": features},
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=True
+        ).encode("utf-8")
+        digest = hashlib.sha1(content).hexdigest()
+        manifest_tiles[key] = dict(summary, hash=digest)
+
+        path = os.path.join(output_dir, str(zoom), str(x), f"{y}.geojson")
+        if previous.get(key, {}).get("hash") == digest and os.path.exists(path):
+            stats["unchanged"] += 1
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, lambda f, data=content: f.write(data))
+        stats["written"] += 1
+
+    removed = [key for key in previous if key not in manifest_tiles]
+    if previous and "stores" not in manifest_data:
+        # 舊版 index.json 沒有記錄門市，無法判斷這些圖磚的門市是否仍在，保留不刪
+        for key in removed:
+            manifest_tiles[key] = previous[key]
+        removed = []
+
+    # 圖磚都寫完才更新 index.json，讀取端不會看到指向不存在圖磚的索引
+    manifest = json.dumps(
+        {
+            "generated_at": generated_at,
+            "zooms": sorted(zooms),
+            "tiles": manifest_tiles,
+            "stores": dict(sorted(store_features.items())),
+        },
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+    os.makedirs(output_dir, exist_ok=True)
+    atomic_write(manifest_path, lambda f: f.write(manifest))
+
+    # index.json 已不再列出這些圖磚後才刪除
+    for key in removed:
+        zoom, x, y = key.split("/")
+        path = os.path.join(output_dir, zoom, x, f"{y}.geojson")
+        if os.path.exists(path):
+            os.remove(path)
+        stats["removed"] += 1
+
+    return stats
+
+
+def main():
+    """從搜尋結果檔匯出圖磚"""
+    parser = argparse.ArgumentParser(description="將搜尋結果匯出成 GeoJSON 圖磚")
+    parser.add_argument("results", nargs="?", default="expired_food_results.json", help="搜尋結果 JSON 檔或欄位式快照")
+    parser.add_argument("--dir", default="tiles", help="輸出目錄")
+    parser.add_argument("--zooms", default=",".join(str(z) for z in DEFAULT_ZOOMS), help="縮放等級，以逗號分隔")
+    args = parser.parse_args()
+
+    with open(args.results, "rb") as f:
+        is_snapshot = f.read(len(MAGIC)) == MAGIC
+
+    # 快照沒有記錄搜尋中心與範圍，只新增或更新門市，不移除上次匯出的門市
+    location, radii = None, None
+    if is_snapshot:
+        stores, query_time = stores_from_snapshot(args.results)
+    else:
+        with open(args.results, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        stores, query_time = results.get("all_stores", []), results.get("query_time", "")
+        location, radii = results.get("location"), ItemIndex.snapshot_radii(results)
+
+    zooms = [int(z) for z in args.zooms.split(",") if z.strip()]
+    stats = export_tiles(stores, args.dir, zooms, query_time, location, radii)
+    print(f"🗺️  圖磚已更新: 重寫 {stats['written']}、未變動 {stats['unchanged']}、刪除 {stats['removed']}")
+
+
+if __name__ == "__main__":
+    main()